@@ -1,15 +1,27 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
+import importlib
+import importlib.util
 import os
 import sys
 from pathlib import Path
 from .utils.logging import Log
 
-from .mods import perceptual
-from .mods import lossless
-from .mods import jpeg_binary_search
-from .mods import hybrid_perceptual
+
+def _run_mod(name, args):
+    return importlib.import_module(f".mods.{name}", __package__).run(args)
+
+def _load(name):
+    """A `run(args)` that imports mods/<name> only once its Mod is chosen.
+
+    Each Mod pulls in its own heavy dependencies; importing all four up front
+    made even `--help` pay for them. It ends up in `args`, which Mods send to
+    process pools, so it is a partial of a module-level function (picklable),
+    not a closure.
+    """
+    return functools.partial(_run_mod, name)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -21,6 +33,12 @@ Example:
   be-humming --input /pngs --output /out lossless-first --target-kb 500
   be-humming --input /jpegs --output /out jpeg-binary-search --target-psnr 40
   be-humming --input /src --output /out hybrid-perceptual --use-butter
+
+Encoder threads:
+  avifenc and cwebp get --avif-threads / --webp-threads each (default:
+  cpu_count // workers), so workers x encoder threads stays near the core
+  count. Raise --workers for many small images, raise the thread counts
+  for a few large ones.
 """
     )
 
@@ -29,6 +47,9 @@ Example:
     parser.add_argument("--workers", "-w", type=int, default=os.cpu_count(), help="Number of parallel workers")
     parser.add_argument("--report-json", type=str, default=None, help="Path to save JSON report")
     parser.add_argument("--report-csv", type=str, default=None, help="Path to save CSV report")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Result cache for hybrid-perceptual and jpeg-binary-search; unchanged inputs with unchanged settings are restored instead of re-searched (default: ~/.cache/be-humming)")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the result cache")
+    parser.add_argument("--scratch-dir", type=str, default=None, help="Directory for intermediate candidates (default: /dev/shm when it has room, else the system temp dir)")
 
     subparsers = parser.add_subparsers(dest="Mod", required=True, help="The compression Mod to use.")
 
@@ -39,7 +60,12 @@ Example:
     p_s1.add_argument("--ssim", type=float, default=0.98, help="Minimum SSIM score to maintain (0.0-1.0)")
     p_s1.add_argument('--no-webp', dest='webp', action='store_false', help="Disable WebP conversion")
     p_s1.add_argument('--no-avif', dest='avif', action='store_false', help="Disable AVIF conversion")
-    p_s1.set_defaults(webp=True, avif=True, func=perceptual.run)
+    p_s1.add_argument("--verify-ssim", action="store_true", help="Re-check WebP candidates with OpenCV SSIM instead of trusting cwebp's own -print_ssim score")
+    p_s1.add_argument("--inner-workers", type=int, default=None, help="Formats (JPEG/WebP/AVIF) to search at once per file (default: up to 3, capped at cores per worker)")
+    p_s1.add_argument("--fast-ssim", action="store_true", help="Score SSIM from integral images instead of scikit-image (same metric, faster on large images)")
+    p_s1.add_argument("--avif-threads", type=int, default=None, help="avifenc threads per image (default: cpu_count // workers)")
+    p_s1.add_argument("--webp-threads", type=int, default=None, help="cwebp threads per image; >1 enables -mt (default: cpu_count // workers)")
+    p_s1.set_defaults(webp=True, avif=True, func=_load("perceptual"))
 
     p_s2 = subparsers.add_parser("lossless-first", help="Lossless-first PNG optimizer (Oxipng, Zopfli, WebP). (Based on Script 2)")
     p_s2.add_argument("--target-kb", type=int, default=None, help="Target max file size in KB. If no lossless candidate meets this, will force lossy WebP.")
@@ -47,7 +73,8 @@ Example:
     p_s2.add_argument("--lossy-quality", type=int, default=85, help="Quality for lossy WebP (if enabled)")
     p_s2.add_argument("--oxipng-level", type=int, default=4, help="Oxipng optimization level (0-6)")
     p_s2.add_argument("--zopfli-iter", type=int, default=15, help="Zopfli iterations")
-    p_s2.set_defaults(func=lossless.run)
+    p_s2.add_argument("--skip-zopfli-if-below-kb", type=int, default=None, help="Skip Zopfli when a faster tool already produced a file this small (KB)")
+    p_s2.set_defaults(func=_load("lossless"))
 
     p_s3 = subparsers.add_parser("jpeg-binary-search", help="JPEG-only binary search for lowest quality that meets perceptual threshold. (Based on Script 3)")
     p_s3.add_argument("--max-side", type=int, default=3000, help="Max side (px) for orientation-aware resize (R2)")
@@ -60,7 +87,7 @@ Example:
     p_s3.add_argument("--target-size-kb", type=int, default=450, help="Preferred target size (KB).")
     p_s3.add_argument("--keep-exif", action="store_true", help="Preserve EXIF data")
     p_s3.add_argument("--extensions", default="jpg,jpeg,JPG,JPEG", help="Comma-separated extensions to include")
-    p_s3.set_defaults(func=jpeg_binary_search.run)
+    p_s3.set_defaults(func=_load("jpeg_binary_search"))
 
 
     p_s4 = subparsers.add_parser("hybrid-perceptual", help="Ultimate: Binary search for smallest perceptual-lossless JPEG, WebP, AND AVIF, then picks the smallest. (Based on Script 4)")
@@ -72,17 +99,19 @@ Example:
     p_s4.add_argument("--target-ssim", type=float, default=0.995)
     p_s4.add_argument("--use-butter", action="store_true", help="Use butteraugli if binary is available (highest precision)")
     p_s4.add_argument("--target-butter", type=float, default=1.0, help="Butteraugli threshold (lower better, <1.0 is ~visually-lossless)")
-    p_S4.add_argument("--target-size-kb", type=int, default=450, help="Desired target size per image in KB.")
+    p_s4.add_argument("--target-size-kb", type=int, default=450, help="Desired target size per image in KB.")
     p_s4.add_argument("--keep-exif", action="store_true", help="Preserve EXIF in JPEG outputs")
     p_s4.add_argument("--extensions", default="jpg,jpeg,png,JPG,JPEG,PNG", help="Comma-separated extensions to include")
-    p_s4.set_defaults(func=hybrid_perceptual.run)
+    p_s4.add_argument("--avif-threads", type=int, default=None, help="avifenc threads per image (default: cpu_count // workers)")
+    p_s4.add_argument("--webp-threads", type=int, default=None, help="cwebp threads per image; >1 enables -mt (default: cpu_count // workers)")
+    p_s4.set_defaults(func=_load("hybrid_perceptual"))
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
         sys.exit(1)
 
     args = parser.parse_args()
-    if args.Mod == "perceptual-best-of" and cv2 is None:
+    if args.Mod == "perceptual-best-of" and importlib.util.find_spec("cv2") is None:
         Log.error("The 'perceptual-best-of' Mod requires OpenCV. Please run: pip install opencv-python-headless")
         sys.exit(1)
 
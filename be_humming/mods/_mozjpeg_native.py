@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import functools
+from pathlib import Path
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420, TJFLAG_PROGRESSIVE
+except ImportError:
+    TurboJPEG = None
+
+from ..utils.metrics import compute_ssim_cv2_pre, load_gray_cv2, probe_reference, ssim_cv2_passes
+from ..utils.search import binary_search
+
+@functools.lru_cache(maxsize=1)
+def _turbojpeg():
+    if TurboJPEG is None:
+        return None
+    try:
+        return TurboJPEG()
+    except Exception:
+        return None  # the Python package is installed but libturbojpeg isn't
+
+def available():
+    """True when PyTurboJPEG and its shared library can be loaded."""
+    return _turbojpeg() is not None
+
+def _decode_bgr(in_file):
+    data = Path(in_file).read_bytes()
+    if data[:2] == b"\xff\xd8":
+        return _turbojpeg().decode(data, pixel_format=TJPF_BGR)
+    import cv2
+    import numpy as np
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def optimize_jpeg_native(in_file, out_file, qualities, ssim_thresh, orig_gray=None, probe_dim=1024, fast_ssim=False):
+    """optimize_jpeg_advanced's search with one decode and in-process encodes.
+
+    `qualities` is the descending quality grid. The source is decoded once
+    and each probe is a libjpeg(-turbo) call on those pixels, scored from
+    memory, with no cjpeg process or temp file per quality. Returns the same
+    (ok, method, size) as optimize_jpeg_advanced.
+    """
+    tj = _turbojpeg()
+    bgr = _decode_bgr(in_file)
+    if orig_gray is None: orig_gray = load_gray_cv2(in_file)
+    if bgr is None or orig_gray is None or not qualities:
+        return False, "Could not decode source", None
+    probe_gray, probe_reduce = probe_reference(in_file, orig_gray, probe_dim)
+    encoded = {}
+
+    def passes(k):
+        q = qualities[k]
+        if q not in encoded:
+            # cjpeg's defaults: 4:2:0 chroma, and progressive implies optimised Huffman tables.
+            data = tj.encode(bgr, quality=q, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420, flags=TJFLAG_PROGRESSIVE)
+            encoded[q] = (data, ssim_cv2_passes(orig_gray, data, ssim_thresh, probe_gray, fast_ssim, probe_reduce))
+        return encoded[q][1]
+
+    if not passes(0):
+        return False, "Could not meet SSIM threshold", None
+    first_fail = binary_search(lambda k: not passes(k), 1, len(qualities) - 1)
+    best_q = qualities[(len(qualities) if first_fail is None else first_fail) - 1]
+
+    data = encoded[best_q][0]
+    Path(out_file).write_bytes(data)
+    final_ssim = compute_ssim_cv2_pre(orig_gray, data, fast_ssim)
+    return True, f"jpeg_q{best_q}_ssim{final_ssim:.3f}", len(data)
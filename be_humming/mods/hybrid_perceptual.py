@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+import io
+import multiprocessing
+import os
 import shutil
 import tempfile
 import json
@@ -9,20 +12,32 @@ from PIL import Image
 from tqdm import tqdm
 
 from ..utils.logging import Log
-from ..utils.shell import run_cmd, which_bin
-from ..utils.metrics import compute_mse_psnr, compute_ssim_skimage, run_butteraugli
+from ..utils.shell import run_cmd, run_cmd_bytes, which_bin
+from ..utils.metrics import (
+    compute_mse_psnr, compute_mse_psnr_fast, compute_ssim_skimage, run_butteraugli,
+    load_rgb, subsample, FAST_PSNR_MARGIN_DB,
+)
+from ..utils.cache import resolve_cache_dir, cache_key, cache_get, cache_put
+from ..utils.fs import make_scratch_dir, scan_images
 from ..utils.image_ops import smart_resize_width_only
-from ..utils.reporting import save_json_report, save_csv_report
+from ..utils.search import search_quality
+from ..utils.parallel import CpuBudget, budget_slots, process_pool, inner_threads
+from ..utils.reporting import ReportStream
 
 def kb_to_bytes(k): return int(k * 1024)
 
-def mozjpeg_save(in_path, out_path, cjpeg_bin, q=85):
-    cmd = [cjpeg_bin, "-quality", str(q), "-optimize", "-progressive", "-sample", "1x1", "-outfile", str(out_path), str(in_path)]
-    return run_cmd(cmd, expected_outpaths=[out_path])
+def mozjpeg_save_to_mem(in_path, cjpeg_bin, q=85, budget=None):
+    """Encodes with cjpeg and returns (ok, jpeg bytes) read from its stdout."""
+    cmd = [cjpeg_bin, "-quality", str(q), "-optimize", "-progressive", "-sample", "1x1", str(in_path)]
+    with budget_slots(budget, 1):
+        return run_cmd_bytes(cmd)
+
+def _as_image(src):
+    return src if isinstance(src, Image.Image) else Image.open(src)
 
 def pillow_save_jpeg(in_path, out_path, q=85, keep_exif=False):
     try:
-        img = Image.open(in_path)
+        img = _as_image(in_path)
         kwargs = {"format": "JPEG", "quality": q, "optimize": True, "progressive": True, "subsampling": 0}
         if keep_exif:
             exif = img.info.get("exif")
@@ -32,111 +47,178 @@ def pillow_save_jpeg(in_path, out_path, q=85, keep_exif=False):
     except Exception as e:
         return False, str(e)
 
-def cwebp_save(in_path, out_path, cwebp_bin, q=80):
-    cmd = [cwebp_bin, "-q", str(q), str(in_path), "-o", str(out_path)]
-    return run_cmd(cmd, expected_outpaths=[out_path])
+def cwebp_save_to_mem(in_path, cwebp_bin, q=80, threads=1, budget=None):
+    """Encodes with cwebp and returns (ok, webp bytes) read from its stdout."""
+    cmd = [cwebp_bin, "-quiet", "-q", str(q), str(in_path), "-o", "-"]
+    if threads > 1: cmd.insert(1, "-mt")
+    with budget_slots(budget, 2 if threads > 1 else 1):
+        return run_cmd_bytes(cmd)
 
 def pillow_save_webp(in_path, out_path, q=80):
     try:
-        img = Image.open(in_path)
+        img = _as_image(in_path)
         img.save(out_path, format="WEBP", quality=q)
         return True, None
     except Exception:
         return False, "Pillow fail"
 
-def avifenc_save(in_path, out_path, avif_bin, q=50):
+def avifenc_save(in_path, out_path, avif_bin, q=50, threads=1, budget=None):
     cq = max(0, min(63, int(q * 63 / 100)))
-    cmd = [avif_bin, "--min", str(cq), "--max", str(cq), str(in_path), str(out_path)]
-    return run_cmd(cmd, expected_outpaths=[out_path])
+    cmd = [avif_bin, "--jobs", str(threads), "--min", str(cq), "--max", str(cq), str(in_path), str(out_path)]
+    with budget_slots(budget, threads):
+        return run_cmd(cmd, expected_outpaths=[out_path], capture_output=False)
+
+def pillow_to_mem(save_fn, img, *a):
+    """Runs a pillow_save_* helper into memory; returns (ok, bytes) or (False, note)."""
+    buf = io.BytesIO()
+    ok, note = save_fn(img, buf, *a)
+    return (True, buf.getvalue()) if ok else (False, note)
+
+def threshold_margin(m, args):
+    """Signed distance of metrics `m` to the active threshold; >= 0 passes."""
+    if args.target_butter and m.get("butter") is not None:
+        return args.target_butter - m["butter"]
+    if args.use_ssim and m.get("ssim") is not None:
+        return m["ssim"] - args.target_ssim
+    return (m.get("psnr") or 0) - args.target_psnr
 
 def binary_search_quality(make_cand_fn, metrics_fn, orig, lo, hi, args, butter_bin):
-    best = None
-    tmpdir = Path(tempfile.mkdtemp(prefix="search_"))
-    try:
-        while lo <= hi:
-            mid = (lo + hi) // 2
-            cand = tmpdir / f"q{mid}.tmp"
-            ok, note = make_cand_fn(mid, cand)
-            if not ok:
-                lo = mid + 1
-                continue
-            
-            m = metrics_fn(orig, cand, butter_bin)
-            
-            passes = True
-            if args.target_butter and m.get("butter") is not None:
-                passes = m["butter"] <= args.target_butter
-            elif args.use_ssim and m.get("ssim") is not None:
-                passes = m["ssim"] >= args.target_ssim
-            else:
-                passes = (m.get("psnr") or 0) >= args.target_psnr
-
-            if passes:
-                best = {"q": mid, "path": cand, "metrics": m}
-                hi = mid - 1
-            else:
-                lo = mid + 1
-
-        if best:
-            dest = tmpdir / f"best_q{best['q']}.bin"
-            shutil.move(str(best["path"]), str(dest))
-            return {"success": True, "q": best["q"], "path": dest, "metrics": best["metrics"]}
-        return {"success": False}
-    finally:
-        pass
+    """Searches [lo, hi] for the lowest q that passes; candidates stay in memory.
+
+    `make_cand_fn(q)` returns (ok, encoded bytes). Only passing candidates are
+    kept, and the caller writes just the overall winner to disk.
+    """
+    passing = {}
+
+    def evaluate(q):
+        ok, data = make_cand_fn(q)
+        if not ok:
+            return None
+        m = metrics_fn(orig, data, butter_bin)
+        margin = threshold_margin(m, args)
+        if margin >= 0:
+            passing[q] = {"q": q, "data": data, "metrics": m}
+        return margin >= 0, margin
+
+    best_q, _ = search_quality(evaluate, lo, hi)
+    best = passing.get(best_q)
+    if best:
+        return {"success": True, **best}
+    return {"success": False}
+
+def process_file(in_file, out_dir, args, bins, budget=None):
+    """_process_file behind the result cache (see utils/cache.py)."""
+    cache_dir = resolve_cache_dir(args)
+    if not cache_dir:
+        return _process_file(in_file, out_dir, args, bins, budget)
+    params = {k: getattr(args, k) for k in ("mode", "min_q", "max_q", "target_psnr", "use_ssim", "target_ssim",
+                                            "use_butter", "target_butter", "keep_exif")}
+    params["encoders"] = sorted(k for k, v in bins.items() if v)
+    key = cache_key(in_file, "hybrid-perceptual", params)
+    hit = cache_get(cache_dir, key, out_dir, in_file)
+    if hit:
+        return {**hit, "file": str(in_file)}
+    res = _process_file(in_file, out_dir, args, bins, budget)
+    if res.get("output_file") and not res.get("error"):
+        cache_put(cache_dir, key, res)
+    return res
 
-def process_file(in_file, out_dir, args, bins):
+def _process_file(in_file, out_dir, args, bins, budget=None):
     in_path = Path(in_file)
     out_dir = Path(out_dir)
     
     res = {"file": str(in_path), "original_bytes": int(in_path.stat().st_size), "method": "none"}
     
-    workdir = Path(tempfile.mkdtemp(prefix="work_"))
+    workdir = make_scratch_dir("work_", args.scratch_dir)
     try:
         resized, work_in = smart_resize_width_only(in_path, workdir / in_path.name)
-        
-        def metrics_fn(orig, cand, butter):
-            mse, psnr = compute_mse_psnr(orig, cand)
-            s = compute_ssim_skimage(orig, cand)
-            b = run_butteraugli(orig, cand, butter) if butter else None
-            return {"psnr": psnr, "ssim": s, "butter": b}
 
-        candidates = []
+        # Decode the source once; Pillow encoders and metrics reuse it for every candidate.
+        src_img = Image.open(work_in)
+        src_img.load()
+        orig_arr = load_rgb(src_img)
+        orig_small = subsample(orig_arr)
+
+        # cjpeg and cwebp read raw PPM without running their own JPEG/PNG
+        # decoder on every probe. avifenc has no PPM reader, and PPM has no
+        # alpha, so those keep work_in. Nothing else reads the PPM, so it is
+        # only written when one of them is installed.
+        enc_in = work_in
+        if src_img.mode in ("RGB", "L") and (bins["cjpeg"] or bins["cwebp"]):
+            enc_in = workdir / f"{in_path.stem}.ppm"
+            src_img.save(enc_in, "PPM")
+
+        def metrics_fn(orig, cand, butter):
+            # Only compute the metric threshold_margin will judge by, in its order of preference.
+            if butter and args.target_butter:
+                # butteraugli reads files, so this is the one metric that spills the candidate.
+                fd, spill = tempfile.mkstemp(dir=workdir, suffix=".bin")
+                with os.fdopen(fd, "wb") as f: f.write(cand)
+                b = run_butteraugli(work_in, spill, butter)
+                os.unlink(spill)
+                if b is not None: return {"butter": b}
+            if args.use_ssim:
+                s = compute_ssim_skimage(orig, cand)
+                if s is not None: return {"ssim": s}
+            # Most probes land far from the target; a quarter-size PSNR settles those.
+            _, psnr = compute_mse_psnr_fast(orig, cand, ref_small=orig_small)
+            if abs(psnr - args.target_psnr) >= FAST_PSNR_MARGIN_DB:
+                return {"psnr": psnr}
+            _, psnr = compute_mse_psnr(orig, cand)
+            return {"psnr": psnr}
+
+        def search(fmt, make_cand, lo, hi):
+            r = binary_search_quality(make_cand, metrics_fn, orig_arr, lo, hi, args, bins["butter"])
+            if not r["success"]: return None
+            return {"fmt": fmt, "bytes": len(r["data"]), "data": r["data"], "q": r["q"]}
+
+        searches = []
 
         if args.mode in ("jpeg", "best"):
-            def make_jpeg(q, p):
-                if bins["cjpeg"]: return mozjpeg_save(work_in, p, bins["cjpeg"], q)
-                return pillow_save_jpeg(work_in, p, q, args.keep_exif)
-            
-            r = binary_search_quality(make_jpeg, metrics_fn, work_in, args.min_q, args.max_q, args, bins["butter"])
-            if r["success"]:
-                candidates.append({"fmt": "jpg", "bytes": int(Path(r["path"]).stat().st_size), "path": r["path"], "q": r["q"]})
+            def make_jpeg(q):
+                if bins["cjpeg"]: return mozjpeg_save_to_mem(enc_in, bins["cjpeg"], q, budget)
+                return pillow_to_mem(pillow_save_jpeg, src_img, q, args.keep_exif)
+
+            searches.append(("jpg", make_jpeg, args.min_q, args.max_q))
 
         if args.mode == "best":
-            def make_webp(q, p):
-                if bins["cwebp"]: return cwebp_save(work_in, p, bins["cwebp"], q)
-                return pillow_save_webp(work_in, p, q)
+            # Image.save keeps per-call encoder state on the image, so the
+            # concurrent WebP search needs its own copy.
+            webp_img = None if bins["cwebp"] else src_img.copy()
 
-            r = binary_search_quality(make_webp, metrics_fn, work_in, 10, 100, args, bins["butter"])
-            if r["success"]:
-                candidates.append({"fmt": "webp", "bytes": int(Path(r["path"]).stat().st_size), "path": r["path"], "q": r["q"]})
+            def make_webp(q):
+                if bins["cwebp"]: return cwebp_save_to_mem(enc_in, bins["cwebp"], q, args.webp_threads, budget)
+                return pillow_to_mem(pillow_save_webp, webp_img, q)
 
-        if args.mode == "best" and bins["avifenc"]:
-            def make_avif(q, p):
-                return avifenc_save(work_in, p, bins["avifenc"], q)
+            searches.append(("webp", make_webp, 10, 100))
 
-            r = binary_search_quality(make_avif, metrics_fn, work_in, 10, 90, args, bins["butter"])
-            if r["success"]:
-                candidates.append({"fmt": "avif", "bytes": int(Path(r["path"]).stat().st_size), "path": r["path"], "q": r["q"]})
+        if args.mode == "best" and bins["avifenc"]:
+            def make_avif(q):
+                # avifenc can't write to stdout; round-trip through scratch and read it back.
+                p = workdir / f"avif_q{q}.avif"
+                ok, note = avifenc_save(work_in, p, bins["avifenc"], q, args.avif_threads, budget)
+                if not ok: return False, note
+                data = p.read_bytes()
+                p.unlink()
+                return True, data
+
+            searches.append(("avif", make_avif, 10, 90))
+
+        # The format searches are independent; run them side by side so a file
+        # takes as long as its slowest format rather than the sum of all three.
+        with ThreadPoolExecutor(max_workers=max(1, len(searches))) as ex:
+            candidates = [c for c in ex.map(lambda s: search(*s), searches) if c]
 
         if candidates:
             best = min(candidates, key=lambda x: x["bytes"])
             out_path = out_dir / f"{in_path.stem}.{best['fmt']}"
-            shutil.move(str(best["path"]), str(out_path))
+            out_path.write_bytes(best["data"])
+            res["output_file"] = str(out_path)
             res["final_bytes"] = best["bytes"]
             res["method"] = f"{best['fmt']} (q={best['q']})"
         else:
             shutil.copy2(in_path, out_dir / in_path.name)
+            res["output_file"] = str(out_dir / in_path.name)
             res["error"] = "No candidates met criteria"
 
     except Exception as e:
@@ -153,26 +235,21 @@ def run(args):
         "avifenc": which_bin(["avifenc"]),
         "butter": which_bin(["butteraugli", "butteraugli.exe"]) if args.use_butter else None
     }
+    if not args.avif_threads: args.avif_threads = inner_threads(args.workers)
+    if not args.webp_threads: args.webp_threads = inner_threads(args.workers)
     
     in_dir = Path(args.input)
     out_dir = Path(args.output)
     out_dir.mkdir(parents=True, exist_ok=True)
     
-    exts = [e.strip() for e in args.extensions.split(",")]
-    files = []
-    for e in exts: files.extend(in_dir.glob(f"*.{e}"))
+    files = scan_images(in_dir, args.extensions.split(","))
     
     Log.info(f"Processing {len(files)} images (Mod 4)...")
-    results = []
-    with ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futures = {ex.submit(process_file, f, out_dir, args, bins): f for f in files}
+    # One thread budget for every worker and format search, so encoder
+    # threads in flight never exceed the core count.
+    with ReportStream(args.report_json, args.report_csv) as report, \
+            multiprocessing.Manager() as manager, process_pool(args.workers) as ex:
+        budget = CpuBudget.shared(manager)
+        futures = {ex.submit(process_file, f, out_dir, args, bins, budget): f for f in files}
         for fut in tqdm(as_completed(futures), total=len(futures)):
-            results.append(fut.result())
-
-    if args.report_json:
-        save_json_report(args.report_json, results)
-
-    if args.report_csv:
-        fieldnames = ["file", "original_size", "final_size", "method", "output_file", "error"]
-        save_csv_report(args.report_csv, results, fieldnames)
-        Log.info(f"CSV report saved to {args.report_csv}")
\ No newline at end of file
+            report.write(fut.result())
\ No newline at end of file
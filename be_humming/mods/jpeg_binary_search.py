@@ -4,16 +4,19 @@ import sys
 import json
 import csv
 import shutil
-import tempfile
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from PIL import Image, ImageOps
 from tqdm import tqdm
 
 from ..utils.logging import Log
-from ..utils.metrics import compute_mse_psnr, compute_ssim_skimage
+from ..utils.metrics import compute_mse_psnr, compute_mse_psnr_fast, compute_ssim_skimage, load_rgb, subsample, FAST_PSNR_MARGIN_DB
+from ..utils.cache import resolve_cache_dir, cache_key, cache_get, cache_put
+from ..utils.fs import make_scratch_dir, move_file, scan_images
 from ..utils.image_ops import resize_orientation_aware_r2
-from ..utils.reporting import save_json_report, save_csv_report
+from ..utils.parallel import process_pool
+from ..utils.search import search_quality, binary_search
+from ..utils.reporting import ReportStream
 
 def bytes_to_kb(b): return round(b / 1024, 2)
 def kb_to_bytes(k): return int(k * 1024)
@@ -34,100 +37,143 @@ def save_jpeg_pillow(in_path, out_path, q=85, subsampling=0, progressive=True, o
     except Exception as e:
         return False, str(e)
 
-def find_best_jpeg(in_work_path, orig_path, tmp_dir, min_q, max_q, target_psnr, target_ssim, use_ssim):
-    lo, hi = min_q, max_q
-    best = None
-    
-    while lo <= hi:
-        mid = (lo + hi) // 2
-        cand_path = Path(tmp_dir) / f"cand_q{mid}.jpg"
-        ok, note = save_jpeg_pillow(in_work_path, cand_path, q=mid)
-        
-        if not ok:
-            lo = mid + 1
-            continue
-            
-        mse, psnr_val = compute_mse_psnr(orig_path, cand_path)
-        ssim_val = compute_ssim_skimage(orig_path, cand_path) if use_ssim else None
-        
-        passes = False
-        if use_ssim and ssim_val is not None:
-            passes = ssim_val >= target_ssim
+def jpeg_evaluator(in_work_path, orig_path, tmp_dir, target_psnr, target_ssim, use_ssim, keep_exif=False):
+    """Returns (encode, evaluate, evaluated) for one input.
+
+    `encode(q)` writes the quality-q candidate once and returns its entry
+    (path and bytes) or None; `evaluate(q)` also scores it in search_quality's
+    (passes, margin) form. `evaluated` maps each encoded q to its candidate.
+    """
+    evaluated = {}
+    orig = load_rgb(orig_path)
+    orig_small = subsample(orig)
+
+    def encode(q):
+        if q not in evaluated:
+            cand_path = Path(tmp_dir) / f"cand_q{q}.jpg"
+            ok, note = save_jpeg_pillow(in_work_path, cand_path, q=q, keep_exif=keep_exif)
+            evaluated[q] = {"q": q, "path": cand_path, "bytes": int(cand_path.stat().st_size)} if ok else None
+        return evaluated[q]
+
+    def evaluate(q):
+        cand = encode(q)
+        if cand is None:
+            return None
+        cand_path = cand["path"]
+
+        if use_ssim:
+            mse, psnr_val = compute_mse_psnr(orig, cand_path)
+            ssim_val = compute_ssim_skimage(orig, cand_path)
         else:
-            if psnr_val is not None: passes = psnr_val >= target_psnr
-            
-        if passes:
-            best = {"q": mid, "path": cand_path, "psnr": psnr_val, "ssim": ssim_val, "bytes": int(cand_path.stat().st_size)}
-            hi = mid - 1
+            # Reject/accept on a quarter-size PSNR unless it's close to the target.
+            mse, psnr_val = compute_mse_psnr_fast(orig, cand_path, ref_small=orig_small)
+            if abs(psnr_val - target_psnr) < FAST_PSNR_MARGIN_DB:
+                mse, psnr_val = compute_mse_psnr(orig, cand_path)
+            ssim_val = None
+
+        if use_ssim and ssim_val is not None:
+            margin = ssim_val - target_ssim
+        elif psnr_val is not None:
+            margin = psnr_val - target_psnr
         else:
-            lo = mid + 1
+            return False, None
 
+        cand.update(psnr=psnr_val, ssim=ssim_val)
+        return margin >= 0, margin
+
+    return encode, evaluate, evaluated
+
+def find_best_jpeg(evaluate, evaluated, min_q, max_q, cache=None):
+    best_q, _ = search_quality(evaluate, min_q, max_q, cache=cache)
+    best = evaluated.get(best_q)
     if best: return {"success": True, **best}
     return {"success": False, "reason": "no q met thresholds"}
 
 def process_file(in_file, out_dir, args):
+    """_process_file behind the result cache (see utils/cache.py)."""
+    cache_dir = resolve_cache_dir(args)
+    if not cache_dir:
+        return _process_file(in_file, out_dir, args)
+    params = {k: getattr(args, k) for k in ("max_side", "min_q", "max_q", "fallback_q", "use_ssim", "target_ssim",
+                                            "target_psnr", "target_size_kb", "keep_exif")}
+    key = cache_key(in_file, "jpeg-binary-search", params)
+    hit = cache_get(cache_dir, key, out_dir, in_file)
+    if hit:
+        return {**hit, "file": str(in_file)}
+    result = _process_file(in_file, out_dir, args)
+    if result.get("output_file") and not result.get("error"):
+        cache_put(cache_dir, key, result)
+    return result
+
+def _process_file(in_file, out_dir, args):
     in_path = Path(in_file)
     out_dir = Path(out_dir)
     
+    orig_bytes = in_path.stat().st_size
     result = {
         "file": str(in_path),
-        "original_bytes": int(in_path.stat().st_size),
-        "final_bytes": int(in_path.stat().st_size),
+        "original_bytes": orig_bytes,
+        "final_bytes": orig_bytes,
         "resized": False,
         "error": None
     }
 
-    tmp_root = Path(tempfile.mkdtemp(prefix="jpgopt_"))
+    tmp_root = make_scratch_dir("jpgopt_", args.scratch_dir)
     try:
         work_in = tmp_root / in_path.name
         resized, work_in = resize_orientation_aware_r2(in_path, work_in, max_side=args.max_side)
         result["resized"] = bool(resized)
         
-        search = find_best_jpeg(str(work_in), str(in_path), tmp_root, args.min_q, args.max_q, args.target_psnr, args.target_ssim, args.use_ssim)
+        encode, evaluate, evaluated = jpeg_evaluator(str(work_in), str(in_path), tmp_root, args.target_psnr, args.target_ssim, args.use_ssim, args.keep_exif)
+        cache = {}
+        search = find_best_jpeg(evaluate, evaluated, args.min_q, args.max_q, cache)
         
         if not search.get("success"):
             fallback = tmp_root / f"fallback.jpg"
             ok, note = save_jpeg_pillow(str(work_in), fallback, q=args.fallback_q, keep_exif=args.keep_exif)
             if ok:
                 final_path = out_dir / in_path.name
-                shutil.move(str(fallback), str(final_path))
+                move_file(fallback, final_path)
+                result["output_file"] = str(final_path)
                 result["final_bytes"] = int(final_path.stat().st_size)
                 result["quality"] = args.fallback_q
                 return result
             else:
                 final_path = out_dir / in_path.name
                 shutil.copy2(in_path, final_path)
+                result["output_file"] = str(final_path)
                 return result
 
         q = int(search["q"])
         cand_path = Path(search["path"])
-        cand_bytes = int(cand_path.stat().st_size)
-
-        if args.target_size_kb and cand_bytes > kb_to_bytes(args.target_size_kb):
-            q_try = q - 1
-            while q_try >= args.min_q:
-                try_path = tmp_root / f"try_q{q_try}.jpg"
-                ok, _ = save_jpeg_pillow(str(work_in), try_path, q=q_try, keep_exif=args.keep_exif)
-                if not ok: break
-                
-                _, psnr_t = compute_mse_psnr(str(in_path), try_path)
-                ssim_t = compute_ssim_skimage(str(in_path), try_path) if args.use_ssim else None
-                
-                passes = True
-                if args.use_ssim and ssim_t: passes = ssim_t >= args.target_ssim
-                else: passes = (psnr_t and psnr_t >= args.target_psnr)
-                
-                if passes:
-                    cand_path = try_path
-                    q = q_try
-                    if int(try_path.stat().st_size) <= kb_to_bytes(args.target_size_kb): break
-                    q_try -= 1
-                else:
-                    break
+        cand_bytes = search["bytes"]
+
+        target = kb_to_bytes(args.target_size_kb) if args.target_size_kb else None
+        if target and cand_bytes > target:
+            # Step below q while candidates still pass and are still too big,
+            # stopping at the first that fits. Bisect for the end of that run
+            # instead of walking it; qualities already scored come from the cache.
+            def passes(t):
+                if t not in cache: cache[t] = evaluate(t)
+                return bool(cache[t] and cache[t][0])
+
+            def too_big_but_passing(t):
+                # Size is a stat away; only decode and score candidates that are still too big.
+                cand = encode(t)
+                return cand is not None and cand["bytes"] > target and passes(t)
+
+            r = binary_search(too_big_but_passing, args.min_q, q - 1)
+            run_end = q if r is None else r
+            if run_end - 1 >= args.min_q and passes(run_end - 1):
+                q = run_end - 1
+            else:
+                q = run_end
+            cand_path, cand_bytes = evaluated[q]["path"], evaluated[q]["bytes"]
 
         final_out = out_dir / in_path.with_suffix(".jpg").name
-        shutil.move(str(cand_path), str(final_out))
-        result["final_bytes"] = int(final_out.stat().st_size)
+        move_file(cand_path, final_out)
+        result["output_file"] = str(final_out)
+        result["final_bytes"] = cand_bytes
         result["quality"] = q
         return result
 
@@ -143,10 +189,7 @@ def run(args):
     out_dir = Path(args.output)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    exts = [e.strip() for e in args.extensions.split(",") if e.strip()]
-    img_files = []
-    for e in exts:
-        img_files.extend(sorted(in_dir.glob(f"*.{e}")))
+    img_files = scan_images(in_dir, args.extensions.split(","))
 
     if not img_files:
         Log.error("No images found.")
@@ -154,16 +197,7 @@ def run(args):
 
     Log.info(f"Processing {len(img_files)} images (Mod 3)...")
 
-    results = []
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    with ReportStream(args.report_json, args.report_csv) as report, process_pool(args.workers) as executor:
         futures = {executor.submit(process_file, f, out_dir, args): f for f in img_files}
         for fut in tqdm(as_completed(futures), total=len(futures), desc="Compressing"):
-            results.append(fut.result())
-
-    if args.report_json:
-        save_json_report(args.report_json, results)
-
-    if args.report_csv:
-        fieldnames = ["file", "original_size", "final_size", "method", "output_file", "error"]
-        save_csv_report(args.report_csv, results, fieldnames)
-        Log.info(f"CSV report saved to {args.report_csv}")
\ No newline at end of file
+            report.write(fut.result())
\ No newline at end of file
@@ -4,15 +4,17 @@ import os
 import sys
 import json
 import csv
-import shutil
+import time
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
 from ..utils.logging import Log
-from ..utils.shell import run_cmd, which_bin
+from ..utils.shell import run_cmd, spawn_cmd, finish_cmd, which_bin
 from ..utils.metrics import files_identical
-from ..utils.reporting import save_json_report, save_csv_report
+from ..utils.fs import move_file, scan_images
+from ..utils.parallel import CpuBudget, budget_slots
+from ..utils.reporting import ReportStream
 
 def to_kb(size_bytes):
     return round(size_bytes / 1024, 2)
@@ -26,20 +28,63 @@ def optimize_with_pillow(in_file, out_file):
     except Exception as e:
         return False, str(e)
 
-def optimize_with_oxipng(in_file, out_file, oxipng_bin, level=4):
+def oxipng_cmd(in_file, out_file, oxipng_bin, level=4, threads=None):
     cmd = [oxipng_bin, "-o", str(level), "--strip", "safe", "-out", str(out_file), str(in_file)]
-    return run_cmd(cmd, expected_outpaths=[out_file])
+    if threads: cmd[1:1] = ["-t", str(threads)]
+    return cmd
+
+def zopflipng_cmd(in_file, out_file, zopfli_bin, iterations=15):
+    return [zopfli_bin, "-y", "-m", "-i", str(iterations), str(in_file), str(out_file)]
+
+def webp_cmd(in_file, out_file, cwebp_bin, lossless=True, q=100):
+    if lossless:
+        return [cwebp_bin, "-lossless", "-q", "100", str(in_file), "-o", str(out_file)]
+    return [cwebp_bin, "-q", str(q), str(in_file), "-o", str(out_file)]
+
+def optimize_with_oxipng(in_file, out_file, oxipng_bin, level=4):
+    return run_cmd(oxipng_cmd(in_file, out_file, oxipng_bin, level), expected_outpaths=[out_file])
 
 def optimize_with_zopflipng(in_file, out_file, zopfli_bin, iterations=15):
-    cmd = [zopfli_bin, "-y", "-m", "-i", str(iterations), str(in_file), str(out_file)]
-    return run_cmd(cmd, expected_outpaths=[out_file])
+    return run_cmd(zopflipng_cmd(in_file, out_file, zopfli_bin, iterations), expected_outpaths=[out_file])
 
 def convert_to_webp(in_file, out_file, cwebp_bin, lossless=True, q=100):
-    if lossless:
-        cmd = [cwebp_bin, "-lossless", "-q", "100", str(in_file), "-o", str(out_file)]
-    else:
-        cmd = [cwebp_bin, "-q", str(q), str(in_file), "-o", str(out_file)]
-    return run_cmd(cmd, expected_outpaths=[out_file])
+    return run_cmd(webp_cmd(in_file, out_file, cwebp_bin, lossless, q), expected_outpaths=[out_file])
+
+def run_tools_concurrently(jobs, on_done, budget=None, timeout=60):
+    """Runs (method, out_file, cmd) jobs side by side.
+
+    `on_done(method, out_file, ok, note)` is called as each one exits and
+    returns the methods still running that are no longer worth waiting for;
+    those are killed and their partial output removed. While the tools run,
+    they hold one budget slot each.
+    """
+    if not jobs: return
+    with budget_slots(budget, len(jobs)):
+        running = {m: (spawn_cmd(cmd), out) for m, out, cmd in jobs}
+
+        def kill(m):
+            proc, out = running.pop(m)
+            proc.kill()
+            proc.wait()
+            if out.exists(): out.unlink()
+
+        deadline = time.monotonic() + timeout
+        try:
+            while running:
+                for m in [m for m, (proc, _) in running.items() if proc.poll() is not None]:
+                    if m not in running: continue
+                    proc, out = running.pop(m)
+                    ok, note = finish_cmd(proc, [out])
+                    for k in on_done(m, out, ok, note) or ():
+                        if k in running: kill(k)
+                if running and time.monotonic() > deadline:
+                    for m in list(running):
+                        cmd0 = running[m][0].args[0]
+                        kill(m)
+                        on_done(m, None, False, f"Command timed out after {timeout}s: {cmd0}")
+                time.sleep(0.02)
+        finally:
+            for m in list(running): kill(m)
 
 def compress_to_webp_target(in_file, out_file, cwebp_bin, target_kb, min_q=30, max_q=95, step=5):
     """Iteratively compress WebP until <= target_kb."""
@@ -56,45 +101,66 @@ def compress_to_webp_target(in_file, out_file, cwebp_bin, target_kb, min_q=30, m
             break
 
     if best_file:
-        shutil.move(best_file, out_file)
+        move_file(best_file, out_file)
         return True, f"webp-q{used_q}", int(final_size * 1024)
     return False, None, None
 
-def process_file(in_path, out_dir, args, bins):
+def process_file(in_path, out_dir, args, bins, budget=None):
     in_path = Path(in_path)
     base_name = in_path.stem
     orig_size = in_path.stat().st_size
     candidates = []
 
-    pillow_out = out_dir / f"{base_name}_pillow.png"
-    ok, note = optimize_with_pillow(in_path, pillow_out)
-    if ok: candidates.append(("pillow", pillow_out, True, note))
-
-    if bins["oxipng"]:
-        oxi_out = out_dir / f"{base_name}_oxipng.png"
-        ok, note = optimize_with_oxipng(in_path, oxi_out, bins["oxipng"], args.oxipng_level)
-        if ok: candidates.append(("oxipng", oxi_out, True, note))
-
-    if bins["zopflipng"]:
-        zop_out = out_dir / f"{base_name}_zopfli.png"
-        ok, note = optimize_with_zopflipng(in_path, zop_out, bins["zopflipng"], args.zopfli_iter)
-        if ok: candidates.append(("zopfli", zop_out, True, note))
+    # Pillow runs in-process and is cheap; if it already meets --target-kb the
+    # external tools never start. Otherwise they run side by side, so a file
+    # costs about as long as Zopfli rather than the sum of all three.
+    target = args.target_kb * 1024 if args.target_kb else None
+    skip_zopfli = args.skip_zopfli_if_below_kb * 1024 if args.skip_zopfli_if_below_kb else None
+    order = ["pillow", "oxipng", "webp_lossless", "zopfli"]
+    best_size = None
+
+    def accept(method, out, ok, note):
+        """Records a finished tool; returns the tools it makes pointless."""
+        nonlocal best_size
+        if ok and method == "webp_lossless": ok = files_identical(in_path, out)
+        if not ok:
+            if out: out.unlink(missing_ok=True)
+            return ()
+        size = out.stat().st_size
+        candidates.append((method, out, size, note))
+        best_size = size if best_size is None else min(best_size, size)
+        if target and size <= target: return order
+        if skip_zopfli and best_size <= skip_zopfli: return ("zopfli",)
+        return ()
 
-    if bins["cwebp"]:
-        webp_out = out_dir / f"{base_name}_lossless.webp"
-        ok, note = convert_to_webp(in_path, webp_out, bins["cwebp"], lossless=True)
-        if ok and files_identical(in_path, webp_out):
-            candidates.append(("webp_lossless", webp_out, True, note))
+    pillow_out = out_dir / f"{base_name}_pillow.png"
+    pillow_done = accept("pillow", pillow_out, *optimize_with_pillow(in_path, pillow_out))
+
+    if "pillow" not in pillow_done:
+        jobs = []
+        if bins["oxipng"]:
+            oxi_out = out_dir / f"{base_name}_oxipng.png"
+            # oxipng is multithreaded; keep it to one thread beside the other tools.
+            jobs.append(("oxipng", oxi_out, oxipng_cmd(in_path, oxi_out, bins["oxipng"], args.oxipng_level, threads=1)))
+        if bins["cwebp"]:
+            webp_out = out_dir / f"{base_name}_lossless.webp"
+            jobs.append(("webp_lossless", webp_out, webp_cmd(in_path, webp_out, bins["cwebp"], lossless=True)))
+        if bins["zopflipng"] and "zopfli" not in pillow_done:
+            zop_out = out_dir / f"{base_name}_zopfli.png"
+            jobs.append(("zopfli", zop_out, zopflipng_cmd(in_path, zop_out, bins["zopflipng"], args.zopfli_iter)))
+        run_tools_concurrently(jobs, accept, budget)
+
+    # Finish order varies between runs; rank ties the same way every time.
+    candidates.sort(key=lambda c: order.index(c[0]))
 
     if args.allow_lossy and args.lossy_quality and bins["cwebp"]:
         lossy_out = out_dir / f"{base_name}_lossy.webp"
         ok, note = convert_to_webp(in_path, lossy_out, bins["cwebp"], lossless=False, q=args.lossy_quality)
-        if ok: candidates.append((f"webp_q{args.lossy_quality}", lossy_out, True, note))
+        if ok: candidates.append((f"webp_q{args.lossy_quality}", lossy_out, lossy_out.stat().st_size, note))
 
+    # Sizes were taken once as each tool finished; every candidate file still exists.
     best = None
-    for method, file, ok, note in candidates:
-        if not ok or not file.exists(): continue
-        size = file.stat().st_size
+    for method, file, size, note in candidates:
         if args.target_kb and size > args.target_kb * 1024:
             continue
         if not best or size < best["final_size"]:
@@ -107,8 +173,7 @@ def process_file(in_path, out_dir, args, bins):
             best = {"method": method, "file": forced_out, "final_size": final_size, "note": "forced lossy"}
 
     if not best:
-        for _, f, _, _ in candidates:
-            if f.exists(): f.unlink()
+        for _, f, _, _ in candidates: f.unlink()
         return {
             "file": str(in_path),
             "original_size": to_kb(orig_size),
@@ -118,10 +183,10 @@ def process_file(in_path, out_dir, args, bins):
         }
 
     final_out = out_dir / in_path.name
-    shutil.move(best["file"], final_out)
+    move_file(best["file"], final_out)
 
     for _, f, _, _ in candidates:
-        if f.exists() and f != final_out: f.unlink()
+        if f is not best["file"]: f.unlink()
 
     return {
         "file": str(in_path),
@@ -142,7 +207,7 @@ def run(args):
     out_dir = Path(args.output)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    png_files = list(in_dir.glob("*.png"))
+    png_files = scan_images(in_dir, ["png"])
     if not png_files:
         Log.error("No PNG files found.")
         sys.exit(1)
@@ -150,11 +215,14 @@ def run(args):
     Log.info(f"Processing {len(png_files)} images (Mod 2)...")
 
     results = []
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures = {executor.submit(process_file, f, out_dir, args, bins): f for f in png_files}
+    # Each file runs up to three tools at once; cap the total at the core count.
+    budget = CpuBudget(os.cpu_count() or 1)
+    with ReportStream(args.report_json, args.report_csv) as report, ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(process_file, f, out_dir, args, bins, budget): f for f in png_files}
         for fut in tqdm(as_completed(futures), total=len(futures), desc="Optimizing"):
             try:
                 results.append(fut.result())
+                report.write(results[-1])
             except Exception as e:
                 Log.error(f"Error: {e}")
 
@@ -166,11 +234,3 @@ def run(args):
             saved = r['original_size'] - r['final_size']
             pct = saved / r['original_size'] * 100 if r['original_size'] else 0
             Log.success(f"{Path(r['file']).name} -> {r['final_size']} KB (saved {pct:.1f}%) [{r['method']}]")
-
-    if args.report_json:
-        save_json_report(args.report_json, results)
-
-    if args.report_csv:
-        fieldnames = ["file", "original_size", "final_size", "method", "output_file", "error"]
-        save_csv_report(args.report_csv, results, fieldnames)
-        Log.info(f"CSV report saved to {args.report_csv}")
\ No newline at end of file
@@ -12,117 +12,197 @@ from tqdm import tqdm
 
 from ..utils.logging import Log
 from ..utils.shell import run_cmd, which_bin
-from ..utils.metrics import compute_ssim_cv2
-from ..utils.reporting import save_json_report, save_csv_report
+from ..utils.metrics import compute_ssim_cv2_pre, load_gray_cv2, probe_reference, ssim_cv2_passes, parse_cwebp_ssim
+from ..utils.fs import make_scratch_dir, move_file, scan_images
+from ..utils.image_ops import resize_max_dimension
+from ..utils.parallel import inner_threads, process_pool
+from ..utils.search import binary_search
+from . import _mozjpeg_native
+from ..utils.reporting import ReportStream
 
 def to_kb(size_bytes):
     return round(size_bytes / 1024, 2)
 
 def resize_image(in_file, out_file, max_dim):
+    """resize_max_dimension without the copy for inputs already within `max_dim`.
+
+    Returns (ok, note, actually_resized); `out_file` is only written when resized.
+    """
     try:
         with Image.open(in_file) as img:
-            if max(img.size) > max_dim:
-                img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
-                img.save(out_file)
-                return True, "Resized"
-            else:
-                shutil.copy2(in_file, out_file)
-                return True, "No resize needed"
+            if max(img.size) <= max_dim:
+                return True, "No resize needed", False
     except Exception as e:
-        return False, str(e)
+        return False, str(e), False
+    ok, note = resize_max_dimension(in_file, out_file, max_dim)
+    return ok, note, ok
 
-def optimize_jpeg_advanced(in_file, out_file, cjpeg_bin, quality_start=90, quality_min=50, ssim_threshold=0.98):
-    best_q, best_size = None, float('inf')
+def optimize_jpeg_advanced(in_file, out_file, cjpeg_bin, quality_start=90, quality_min=50, ssim_threshold=0.98, orig_gray=None, probe_workers=1, probe_dim=1024, fast_ssim=False):
+    """Lowest q on the quality_start..quality_min (step 2) grid whose SSIM passes.
 
-    for q in range(quality_start, quality_min -1, -2):
-        cmd = [cjpeg_bin, "-quality", str(q), "-optimize", "-progressive", "-outfile", str(out_file), str(in_file)]
-        ok, note = run_cmd(cmd, expected_outpaths=[out_file])
-        if not ok:
-            continue
+    Rather than encoding every grid step from the top, four spread-out
+    qualities are probed, at once when `probe_workers` allows (cjpeg is
+    single-threaded), then the grid between the last passing and first
+    failing probe is bisected. Probes below a failing one are not encoded.
 
-        current_ssim = compute_ssim_cv2(in_file, out_file)
-        if current_ssim >= ssim_threshold:
-            current_size = out_file.stat().st_size
-            best_q, best_size = q, current_size
-        else:
+    Probes are first scored at about `probe_dim` px (see probe_reference).
+    Downscaling averages away compression noise, so that score runs high: a
+    miss there is final, and only probes that clear it are confirmed at full
+    resolution.
+
+    With PyTurboJPEG installed the sweep runs in-process instead (see
+    _mozjpeg_native); `cjpeg_bin` is then unused.
+    """
+    if orig_gray is None: orig_gray = load_gray_cv2(in_file)
+    grid = list(range(quality_start, quality_min - 1, -2))
+    if _mozjpeg_native.available():
+        return _mozjpeg_native.optimize_jpeg_native(in_file, out_file, grid, ssim_threshold, orig_gray, probe_dim, fast_ssim)
+
+    probe_gray, probe_reduce = probe_reference(in_file, orig_gray, probe_dim) if orig_gray is not None else (None, 1)
+    passed = {}
+
+    def probe_path(q):
+        return out_file.with_name(f"{out_file.stem}_q{q}{out_file.suffix}")
+
+    def passes(q):
+        # Passing probes stay on disk so the winner never has to be re-encoded.
+        if q not in passed:
+            probe_out = probe_path(q)
+            cmd = [cjpeg_bin, "-quality", str(q), "-optimize", "-progressive", "-outfile", str(probe_out), str(in_file)]
+            ok, note = run_cmd(cmd, expected_outpaths=[probe_out])
+            passed[q] = ok and ssim_cv2_passes(orig_gray, probe_out, ssim_threshold, probe_gray, fast_ssim, probe_reduce)
+            if not passed[q] and probe_out.exists(): probe_out.unlink()
+        return passed[q]
+
+    # A failing probe means nothing below it can be the answer, so lower probes
+    # are skipped from then on; serially that is a top-down stop at the first miss.
+    probes = list(range(0, len(grid), 5))[:4]
+    first_miss = len(grid)
+
+    def probe(k):
+        nonlocal first_miss
+        if k < first_miss and not passes(grid[k]): first_miss = min(first_miss, k)
+
+    workers = max(1, min(probe_workers, len(probes)))
+    if workers == 1:
+        for k in probes: probe(k)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(probe, probes))
+
+    best_q = None
+    last_pass = next_fail = None
+    for k in probes:
+        if not passed[grid[k]]:
+            next_fail = k
             break
+        last_pass = k
+    if last_pass is not None:
+        if next_fail is None: next_fail = len(grid)
+        first_fail = binary_search(lambda k: not passes(grid[k]), last_pass + 1, next_fail - 1)
+        best_q = grid[(next_fail if first_fail is None else first_fail) - 1]
+
+    for q, ok in passed.items():
+        if ok and q != best_q: probe_path(q).unlink(missing_ok=True)
 
     if best_q is not None:
-        cmd = [cjpeg_bin, "-quality", str(best_q), "-optimize", "-progressive", "-outfile", str(out_file), str(in_file)]
-        run_cmd(cmd, expected_outpaths=[out_file])
-        final_ssim = compute_ssim_cv2(in_file, out_file)
+        move_file(probe_path(best_q), out_file)
+        final_ssim = compute_ssim_cv2_pre(orig_gray, out_file, fast_ssim)
         return True, f"jpeg_q{best_q}_ssim{final_ssim:.3f}", out_file.stat().st_size
     else:
         if out_file.exists(): out_file.unlink()
         return False, "Could not meet SSIM threshold", None
 
-def convert_to_webp(in_file, out_file, cwebp_bin, quality=85, ssim_threshold=0.98):
-    """Converts image to lossy WebP."""
-    cmd = [cwebp_bin, "-q", str(quality), "-m", "6", "-pass", "10", "-low_memory", str(in_file), "-o", str(out_file)]
+def convert_to_webp(in_file, out_file, cwebp_bin, quality=85, ssim_threshold=0.98, threads=1, orig_gray=None, verify_ssim=False, fast_ssim=False):
+    """Converts image to lossy WebP.
+
+    cwebp scores its own output (-print_ssim) from pixels it already holds;
+    the OpenCV re-decode only runs with `verify_ssim` or if that line is missing.
+    """
+    cmd = [cwebp_bin, "-q", str(quality), "-m", "6", "-pass", "10", "-low_memory", "-print_ssim", str(in_file), "-o", str(out_file)]
+    if threads > 1: cmd.insert(1, "-mt")
     ok, note = run_cmd(cmd, expected_outpaths=[out_file])
     if not ok or not out_file.exists():
         return False, note, None
-    final_ssim = compute_ssim_cv2(in_file, out_file)
+    final_ssim = None if verify_ssim else parse_cwebp_ssim(note)
+    if final_ssim is None:
+        final_ssim = compute_ssim_cv2_pre(load_gray_cv2(in_file) if orig_gray is None else orig_gray, out_file, fast_ssim)
     if final_ssim < ssim_threshold:
         if out_file.exists(): out_file.unlink()
         return False, f"WebP SSIM {final_ssim:.3f} below threshold", None
     return True, f"webp_q{quality}_ssim{final_ssim:.3f}", out_file.stat().st_size
 
-def convert_to_avif(in_file, out_file, avifenc_bin, quality=50, ssim_threshold=0.98):
+def convert_to_avif(in_file, out_file, avifenc_bin, quality=50, ssim_threshold=0.98, threads=1, orig_gray=None, fast_ssim=False):
     """Converts image to AVIF."""
-    cmd = [avifenc_bin, "-j", "all", "-s", "4", "-y", "420", "--min", str(quality - 5), "--max", str(quality + 5), str(in_file), str(out_file)]
+    cmd = [avifenc_bin, "-j", str(threads), "-s", "4", "-y", "420", "--min", str(quality - 5), "--max", str(quality + 5), str(in_file), str(out_file)]
     ok, note = run_cmd(cmd, expected_outpaths=[out_file])
     if not ok or not out_file.exists():
         return False, note, None
-    final_ssim = compute_ssim_cv2(in_file, out_file)
+    final_ssim = compute_ssim_cv2_pre(load_gray_cv2(in_file) if orig_gray is None else orig_gray, out_file, fast_ssim)
     if final_ssim < ssim_threshold:
         if out_file.exists(): out_file.unlink()
         return False, f"AVIF SSIM {final_ssim:.3f} below threshold", None
     return True, f"avif_cq{quality}_ssim{final_ssim:.3f}", out_file.stat().st_size
 
 def process_file(in_path, out_dir, args, bins):
-    in_path = Path(in_path)
+    # Candidates live in a per-file scratch dir (tmpfs when available); only the winner reaches out_dir.
+    temp_dir = make_scratch_dir("perc_", args.scratch_dir)
+    try:
+        return _process_file(Path(in_path), out_dir, args, bins, temp_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _process_file(in_path, out_dir, args, bins, temp_dir):
     base_name = in_path.stem
     orig_size = in_path.stat().st_size
-    temp_dir = out_dir / "temp"
-    temp_dir.mkdir(exist_ok=True)
 
     temp_resized_file = temp_dir / f"{base_name}{in_path.suffix}"
+    source_file_for_compression = in_path
     if args.resize:
-        ok, note = resize_image(in_path, temp_resized_file, args.resize)
+        ok, note, resized = resize_image(in_path, temp_resized_file, args.resize)
         if not ok:
             return {"file": str(in_path), "error": f"Resize failed: {note}"}
-        source_file_for_compression = temp_resized_file
-    else:
-        source_file_for_compression = in_path
+        if resized: source_file_for_compression = temp_resized_file
 
-    candidates = []
+    # JPEG has no alpha: cjpeg would flatten a transparent source, so skip the whole sweep.
+    try:
+        with Image.open(source_file_for_compression) as im:
+            has_alpha = im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+    except Exception:
+        has_alpha = False
 
-    if bins["cjpeg"]:
-        jpeg_out = temp_dir / f"{base_name}_optim.jpg"
-        ok, method, size = optimize_jpeg_advanced(source_file_for_compression, jpeg_out, bins["cjpeg"], ssim_threshold=args.ssim)
-        if ok: candidates.append({"method": method, "file": jpeg_out, "size": size})
+    # Decoded once here; every candidate's SSIM is measured against it.
+    orig_gray = load_gray_cv2(source_file_for_compression)
+    src = source_file_for_compression
 
+    # The three formats are independent, so they run side by side (each job returns (ok, method, size)).
+    jobs = []
+    if not has_alpha and (bins["cjpeg"] or _mozjpeg_native.available()):
+        jobs.append((temp_dir / f"{base_name}_optim.jpg", lambda out: optimize_jpeg_advanced(
+            src, out, bins["cjpeg"], ssim_threshold=args.ssim, orig_gray=orig_gray,
+            probe_workers=min(4, inner_threads(args.workers)), fast_ssim=args.fast_ssim)))
     if args.webp and bins["cwebp"]:
-        webp_out = temp_dir / f"{base_name}.webp"
-        ok, method, size = convert_to_webp(source_file_for_compression, webp_out, bins["cwebp"], quality=args.quality, ssim_threshold=args.ssim)
-        if ok: candidates.append({"method": method, "file": webp_out, "size": size})
-
+        jobs.append((temp_dir / f"{base_name}.webp", lambda out: convert_to_webp(
+            src, out, bins["cwebp"], quality=args.quality, ssim_threshold=args.ssim, threads=args.webp_threads,
+            orig_gray=orig_gray, verify_ssim=args.verify_ssim, fast_ssim=args.fast_ssim)))
     if args.avif and bins["avifenc"]:
-        avif_out = temp_dir / f"{base_name}.avif"
-        ok, method, size = convert_to_avif(source_file_for_compression, avif_out, bins["avifenc"], quality=args.quality_avif, ssim_threshold=args.ssim)
-        if ok: candidates.append({"method": method, "file": avif_out, "size": size})
+        jobs.append((temp_dir / f"{base_name}.avif", lambda out: convert_to_avif(
+            src, out, bins["avifenc"], quality=args.quality_avif, ssim_threshold=args.ssim, threads=args.avif_threads,
+            orig_gray=orig_gray, fast_ssim=args.fast_ssim)))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(args.inner_workers, len(jobs)))) as ex:
+        futures = [(out, ex.submit(fn, out)) for out, fn in jobs]
+    candidates = []
+    # Submission order, not completion order, so ties between formats resolve the same way every run.
+    for out, fut in futures:
+        ok, method, size = fut.result()
+        if ok: candidates.append({"method": method, "file": out, "size": size})
     if not candidates:
-        if temp_resized_file.exists(): temp_resized_file.unlink()
         return {"file": str(in_path), "original_size": to_kb(orig_size), "final_size": to_kb(orig_size), "method": "none", "error": "No compression method was successful or met quality threshold."}
 
     best_candidate = min(candidates, key=lambda x: x['size'])
     final_out_path = out_dir / best_candidate['file'].name
-    shutil.move(best_candidate['file'], final_out_path)
-
-    for cand in candidates:
-        if cand['file'].exists(): cand['file'].unlink()
-    if temp_resized_file.exists(): temp_resized_file.unlink()
+    move_file(best_candidate['file'], final_out_path)
 
     return {
         "file": str(in_path),
@@ -138,16 +218,19 @@ def run(args):
         "cwebp": which_bin(["cwebp"]),
         "avifenc": which_bin(["avifenc"])
     }
-    if not bins["cjpeg"]: Log.warn("mozjpeg (cjpeg) not found. JPEG optimization will be skipped.")
+    if not bins["cjpeg"] and not _mozjpeg_native.available(): Log.warn("mozjpeg (cjpeg) not found. JPEG optimization will be skipped.")
     if not bins["cwebp"]: Log.warn("cwebp not found. WebP conversion will be skipped.")
     if not bins["avifenc"]: Log.warn("avifenc not found. AVIF conversion will be skipped.")
+    if not args.avif_threads: args.avif_threads = inner_threads(args.workers)
+    if not args.webp_threads: args.webp_threads = inner_threads(args.workers)
+    # Formats searched at once per file; by default no more than this worker's share of the cores.
+    if not args.inner_workers: args.inner_workers = min(3, inner_threads(args.workers))
 
     in_dir = Path(args.input)
     out_dir = Path(args.output)
     out_dir.mkdir(parents=True, exist_ok=True)
-    (out_dir / "temp").mkdir(exist_ok=True)
 
-    img_files = sorted([*in_dir.glob("*.png"), *in_dir.glob("*.jpg"), *in_dir.glob("*.jpeg")])
+    img_files = scan_images(in_dir, ("png", "jpg", "jpeg"))
     if not img_files:
         Log.error("No compatible image files found in input folder.")
         sys.exit(1)
@@ -157,17 +240,16 @@ def run(args):
     if args.resize: Log.info(f"Resizing images to max dimension: {args.resize}px")
 
     results = []
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    # SSIM and resizing are CPU-bound Python/NumPy work, so files go to processes, not threads.
+    with ReportStream(args.report_json, args.report_csv) as report, process_pool(args.workers) as executor:
         futures = {executor.submit(process_file, f, out_dir, args, bins): f for f in img_files}
         for fut in tqdm(as_completed(futures), total=len(futures), desc="Compressing (Mod 1)"):
             try:
                 results.append(fut.result())
+                report.write(results[-1])
             except Exception as e:
                 Log.error(f"Error processing {futures[fut]}: {e}")
 
-    try: (out_dir / "temp").rmdir()
-    except OSError: pass 
-
     Log.info("--- Compression Summary ---")
     total_orig_size = sum(r.get('original_size', 0) for r in results)
     total_final_size = sum(r.get('final_size', 0) for r in results)
@@ -186,11 +268,3 @@ def run(args):
         Log.success(f"Total size before: {total_orig_size / 1024:.2f} MB")
         Log.success(f"Total size after:  {total_final_size / 1024:.2f} MB")
         Log.header(f"Total savings: {total_saved / 1024:.2f} MB ({total_pct:.1f}%)")
-
-    if args.report_json:
-        save_json_report(args.report_json, results)
-
-    if args.report_csv:
-        fieldnames = ["file", "original_size", "final_size", "method", "output_file", "error"]
-        save_csv_report(args.report_csv, results, fieldnames)
-        Log.info(f"CSV report saved to {args.report_csv}")
\ No newline at end of file
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from pathlib import Path
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Bump when a Mod's output for the same input and settings changes.
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "be-humming"
+
+def resolve_cache_dir(args):
+    """The cache directory for this run, or None when --no-cache was given."""
+    if args.no_cache:
+        return None
+    return Path(args.cache_dir) if args.cache_dir else DEFAULT_CACHE_DIR
+
+def file_digest(path):
+    """Content hash of `path`: BLAKE3 when the blake3 package is installed, else BLAKE2b."""
+    h = blake3.blake3() if blake3 else hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+    return ("b3" if blake3 else "b2") + h.hexdigest()
+
+def cache_key(in_path, mod, params):
+    """Key for `in_path`'s content processed by `mod` with the settings in `params`."""
+    canon = json.dumps({"v": CACHE_VERSION, "mod": mod, **params}, sort_keys=True, default=str)
+    return f"{file_digest(in_path)}-{hashlib.blake2b(canon.encode(), digest_size=8).hexdigest()}"
+
+def _tmp_name(path):
+    return Path(path).with_name(f".{Path(path).name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def copy_atomic(src, dst):
+    """Copies `src` over `dst` via a temp file and rename, so `dst` is never half-written.
+
+    A copy, not a hard link: outputs and cache blobs must not share an inode,
+    or editing an output in place would silently change the cached blob.
+    """
+    tmp = _tmp_name(dst)
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp): os.unlink(tmp)
+
+def cache_get(cache_dir, key, out_dir, in_path):
+    """Restores the output cached under `key` into `out_dir` for `in_path`.
+
+    Keys cover content, not names, so a copy or rename of an earlier input
+    hits the same entry: the output is named after `in_path`'s stem (with the
+    cached output's suffix), not after whichever file stored it.
+    Returns the cached result dict (with output_file pointing into `out_dir`),
+    or None on a miss.
+    """
+    try:
+        entry = json.loads((Path(cache_dir) / f"{key}.json").read_text())
+        out_path = Path(out_dir) / f"{Path(in_path).stem}{Path(entry['output_name']).suffix}"
+        copy_atomic(Path(cache_dir) / entry["blob"], out_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return {**entry["result"], "output_file": str(out_path), "cached": True}
+
+def cache_put(cache_dir, key, result):
+    """Stores `result` and its output_file under `key`. A failure only costs the cache entry."""
+    try:
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        out_path = Path(result["output_file"])
+        blob = f"{key}{out_path.suffix}"
+        copy_atomic(out_path, cache_dir / blob)
+        entry = {"blob": blob, "output_name": out_path.name, "result": result}
+        meta = cache_dir / f"{key}.json"
+        tmp = _tmp_name(meta)
+        tmp.write_text(json.dumps(entry))
+        os.replace(tmp, meta)
+    except (OSError, KeyError, TypeError, ValueError):
+        pass
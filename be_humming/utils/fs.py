@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+def _ram_scratch(path="/dev/shm", min_free=256 * 1024 * 1024):
+    """`path` if it is a writable tmpfs with room for a batch's candidates, else None."""
+    try:
+        if not (os.path.isdir(path) and os.access(path, os.W_OK)):
+            return None
+        st = os.statvfs(path)
+        # Containers often mount a 64 MB /dev/shm; spilling there would fail mid-batch.
+        return path if st.f_bavail * st.f_frsize >= min_free else None
+    except (OSError, AttributeError):
+        return None
+
+# Intermediate candidates are written and read straight back; keep them in RAM when we can.
+SCRATCH_DIR = _ram_scratch()
+
+def make_scratch_dir(prefix, scratch_dir=None):
+    """mkdtemp under `scratch_dir`, else SCRATCH_DIR, else the system temp dir."""
+    return Path(tempfile.mkdtemp(prefix=prefix, dir=scratch_dir or SCRATCH_DIR))
+
+def move_file(src, dst):
+    """Renames `src` to `dst`, copying only when they sit on different filesystems.
+
+    os.replace is a single rename on one filesystem (and overwrites `dst` on
+    Windows too); shutil.move's copy-and-unlink is kept for the cross-device
+    case, e.g. a tmpfs scratch dir and a disk output dir.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(str(src), str(dst))
+
+def scan_images(in_dir, exts):
+    """Files in `in_dir` whose extension is in `exts` (any case), largest first.
+
+    One scandir pass replaces a glob per extension, and its cached stat
+    sizes order the queue so the longest jobs start first.
+    """
+    ext_set = {e.strip().lstrip(".").lower() for e in exts if e.strip()}
+    found = []
+    with os.scandir(in_dir) as it:
+        for e in it:
+            ext = e.name.rpartition(".")[2].lower() if "." in e.name else None
+            if ext in ext_set and e.is_file():
+                found.append((e.stat().st_size, Path(e.path)))
+    found.sort(key=lambda t: -t[0])
+    return [p for _, p in found]
@@ -4,10 +4,63 @@ import shutil
 from pathlib import Path
 from PIL import Image, ImageOps
 
+def _cv2():
+    try:
+        import cv2
+    except ImportError:
+        return None
+    return cv2
+
+def _cv2_resize(img, in_path, out_path, size, exif_rotate=False):
+    """Resizes `in_path` to `size` with OpenCV's INTER_AREA and writes `out_path`.
+
+    INTER_AREA is vectorised and several times faster than Pillow's LANCZOS
+    for downscaling. Only plain 8-bit RGB/L sources without an ICC profile
+    or a transparency key (tRNS) take this path, so nothing Pillow would
+    have carried over is lost.
+    Returns False when the caller should fall back to Pillow.
+    """
+    cv2 = _cv2()
+    if cv2 is None or img.mode not in ("RGB", "L") or "icc_profile" in img.info or "transparency" in img.info:
+        return False
+    gray = img.mode == "L"
+    flags = cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR
+    if img.format == "JPEG":
+        # Same idea as _draft: let libjpeg decode at 1/2, 1/4 or 1/8 scale.
+        long_in, long_out = max(img.size), max(size)
+        for f, g, c in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8, cv2.IMREAD_REDUCED_COLOR_8),
+                        (4, cv2.IMREAD_REDUCED_GRAYSCALE_4, cv2.IMREAD_REDUCED_COLOR_4),
+                        (2, cv2.IMREAD_REDUCED_GRAYSCALE_2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if long_in // f >= long_out:
+                flags = g if gray else c
+                break
+    if not exif_rotate:
+        flags |= cv2.IMREAD_IGNORE_ORIENTATION
+    arr = cv2.imread(str(in_path), flags)
+    if arr is None:
+        return False
+    arr = cv2.resize(arr, (int(size[0]), int(size[1])), interpolation=cv2.INTER_AREA)
+    # Pillow's save defaults, so outputs match the fallback path.
+    suffix = Path(out_path).suffix.lower()
+    params = [cv2.IMWRITE_JPEG_QUALITY, 75] if suffix in (".jpg", ".jpeg") else [cv2.IMWRITE_PNG_COMPRESSION, 6] if suffix == ".png" else []
+    return cv2.imwrite(str(out_path), arr, params)
+
+def _draft(img, size):
+    """For a JPEG about to be shrunk to `size`, let libjpeg decode at 1/2, 1/4 or 1/8 scale.
+
+    The scaled IDCT skips most of the full-resolution decode; Pillow keeps the
+    result at least `size`, so the LANCZOS pass still does the final resize.
+    """
+    if img.format == "JPEG":
+        img.draft(img.mode, (max(1, int(size[0])), max(1, int(size[1]))))
+
 def resize_max_dimension(in_file, out_file, max_dim):
     try:
         with Image.open(in_file) as img:
             if max(img.size) > max_dim:
+                scale = max_dim / max(img.size)
+                if _cv2_resize(img, in_file, out_file, (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale)))):
+                    return True, "Resized"
                 img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
                 img.save(out_file)
                 return True, "Resized"
@@ -20,21 +73,19 @@ def resize_max_dimension(in_file, out_file, max_dim):
 def resize_orientation_aware_r2(in_path, out_path, max_side=3000):
     try:
         img = Image.open(in_path)
-        img = ImageOps.exif_transpose(img)
         w, h = img.size
-
-        if w >= h:
-            if w > max_side:
-                new_h = int(h * (max_side / w))
-                img = img.resize((max_side, new_h), Image.Resampling.LANCZOS)
-                img.save(out_path)
-                return True, out_path
-        else:
-            if h > max_side:
-                new_w = int(w * (max_side / h))
-                img = img.resize((new_w, max_side), Image.Resampling.LANCZOS)
-                img.save(out_path)
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            w, h = h, w  # exif_transpose will swap the sides
+        if max(w, h) > max_side:
+            # Sizes come from the full-resolution header, not the drafted image.
+            new_w, new_h = (max_side, int(h * (max_side / w))) if w >= h else (int(w * (max_side / h)), max_side)
+            if _cv2_resize(img, in_path, out_path, (new_w, new_h), exif_rotate=True):
                 return True, out_path
+            _draft(img, (new_w, new_h) if img.size[0] == w else (new_h, new_w))
+            img = ImageOps.exif_transpose(img)
+            img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+            img.save(out_path)
+            return True, out_path
 
         shutil.copy2(in_path, out_path)
         return False, out_path
@@ -47,6 +98,9 @@ def smart_resize_width_only(in_path, out_path, max_width=3000):
         width, height = img.size
         if width > max_width:
             new_h = int(height * (max_width / width))
+            if _cv2_resize(img, in_path, out_path, (max_width, new_h)):
+                return True, out_path
+            _draft(img, (max_width, new_h))
             img = img.resize((max_width, new_h), Image.Resampling.LANCZOS)
             img.save(out_path)
             return True, out_path
@@ -1,29 +1,43 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+
+# Colour only for an interactive terminal; piped or redirected output stays plain text.
+_COLOR = getattr(sys.stdout, "isatty", lambda: False)() and not os.environ.get("NO_COLOR")
+
 class Log:
-    HEADER = "\033[95m"
-    OKBLUE = "\033[94m"
-    OKGREEN = "\033[92m"
-    WARNING = "\033[93m"
-    FAIL = "\033[91m"
-    ENDC = "\033[0m"
+    HEADER = "\033[95m" if _COLOR else ""
+    OKBLUE = "\033[94m" if _COLOR else ""
+    OKGREEN = "\033[92m" if _COLOR else ""
+    WARNING = "\033[93m" if _COLOR else ""
+    FAIL = "\033[91m" if _COLOR else ""
+    ENDC = "\033[0m" if _COLOR else ""
+
+    # Built once, so each call is a single concatenation.
+    INFO_P = f"{OKBLUE}[INFO]{ENDC} "
+    SUCCESS_P = f"{OKGREEN}[SUCCESS]{ENDC} "
+    WARN_P = f"{WARNING}[WARN]{ENDC} "
+    ERROR_P = f"{FAIL}[ERROR]{ENDC} "
+    HEADER_P = f"{HEADER}[---- "
+    HEADER_S = f" ----]{ENDC}"
 
     @staticmethod
     def info(msg):
-        print(f"{Log.OKBLUE}[INFO]{Log.ENDC} {msg}")
+        print(Log.INFO_P + str(msg))
 
     @staticmethod
     def success(msg):
-        print(f"{Log.OKGREEN}[SUCCESS]{Log.ENDC} {msg}")
+        print(Log.SUCCESS_P + str(msg))
 
     @staticmethod
     def warn(msg):
-        print(f"{Log.WARNING}[WARN]{Log.ENDC} {msg}")
+        print(Log.WARN_P + str(msg))
 
     @staticmethod
     def error(msg):
-        print(f"{Log.FAIL}[ERROR]{Log.ENDC} {msg}")
+        print(Log.ERROR_P + str(msg))
 
     @staticmethod
     def header(msg):
-        print(f"{Log.HEADER}[---- {msg} ----]{Log.ENDC}")
\ No newline at end of file
+        print(Log.HEADER_P + str(msg) + Log.HEADER_S)
@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
+import filecmp
+import functools
+import importlib
+import io
 import math
+import os
 import re
 from pathlib import Path
 from PIL import Image, ImageChops
@@ -10,35 +15,143 @@ try:
 except ImportError:
     np = None
 
-try:
-    from skimage.metrics import structural_similarity as ssim_func
-except ImportError:
-    ssim_func = None
-
-try:
-    import cv2
-except ImportError:
-    cv2 = None
-
 from .logging import Log
 from .shell import run_cmd
 
+# Compiled once; these run on every candidate scored by butteraugli or cwebp -print_ssim.
+_BUTTERAUGLI_RE = re.compile(r"([0-9]+(?:\.[0-9]+)?)")
+_CWEBP_SSIM_RE = re.compile(r"Total:\s*([0-9]+(?:\.[0-9]+)?)")
+
+@functools.lru_cache(maxsize=None)
+def _optional(name):
+    """Imports `name` on first use, or None if it is not installed.
+
+    OpenCV and scikit-image (via SciPy) cost ~300 ms to import; only the
+    SSIM paths need them, so PSNR and lossless runs never load them.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+def _cv2():
+    return _optional("cv2")
+
+def _ssim_func():
+    m = _optional("skimage.metrics")
+    return m.structural_similarity if m else None
+
+def _fast():
+    m = _optional(f"{__package__}.metrics_fast")
+    return m if m is not None and m.cv2 is not None else None
+
+def _cuda():
+    """metrics_cuda when OpenCV has a usable CUDA device, else None."""
+    m = _optional(f"{__package__}.metrics_cuda")
+    return m if m is not None and m.cuda_available() else None
+
+def _stat_key(path):
+    st = os.stat(path)
+    return str(Path(path).resolve()), st.st_mtime_ns, st.st_size
+
 def files_identical(f1, f2):
+    """True when `f1` and `f2` decode to the same pixels.
+
+    Answers are memoised on each file's (path, mtime, size), so re-checking
+    an unchanged pair costs two stats.
+    """
     try:
-        i1, i2 = Image.open(f1), Image.open(f2)
-        if i1.mode != i2.mode or i1.size != i2.size:
-            return False
-        diff = ImageChops.difference(i1, i2)
-        return not diff.getbbox()
+        return _files_identical(_stat_key(f1), _stat_key(f2))
+    except OSError:
+        return False
+
+@functools.lru_cache(maxsize=256)
+def _files_identical(k1, k2):
+    # Different sizes prove nothing here (e.g. a PNG and its lossless WebP).
+    # Equal-size, byte-identical files only need one decode, which must still
+    # succeed: an undecodable file is never "identical".
+    try:
+        if k1[2] == k2[2] and filecmp.cmp(k1[0], k2[0], shallow=False):
+            with Image.open(k1[0]) as i1:
+                i1.load()
+            return True
+        with Image.open(k1[0]) as i1, Image.open(k2[0]) as i2:
+            if i1.mode != i2.mode or i1.size != i2.size:
+                return False
+            diff = ImageChops.difference(i1, i2)
+            return not diff.getbbox()
     except Exception:
         return False
 
+def _open_rgb(src):
+    if isinstance(src, Image.Image):
+        return src.convert("RGB")
+    if isinstance(src, bytes):
+        return Image.open(io.BytesIO(src)).convert("RGB")
+    return Image.open(src).convert("RGB")
+
+# Only one candidate's PSNR and SSIM share a decode, and each entry pins a
+# full frame, so these stay tiny.
+@functools.lru_cache(maxsize=2)
+def _decode_rgb_cached(path, mtime_ns, size):
+    with Image.open(path) as img:
+        arr = np.asarray(img.convert("RGB"))
+    arr.setflags(write=False)
+    return arr
+
+@functools.lru_cache(maxsize=2)
+def _decode_rgb_bytes(data):
+    with Image.open(io.BytesIO(data)) as img:
+        arr = np.asarray(img.convert("RGB"))
+    arr.setflags(write=False)
+    return arr
+
+def load_rgb(src):
+    """Decodes a path, encoded bytes, PIL image or array to an RGB uint8 array.
+
+    Paths are cached on (path, mtime, size) and bytes on their content, so
+    the PSNR and SSIM of one candidate share a single decode. Without numpy,
+    `src` is returned as-is.
+    """
+    if np is None or isinstance(src, np.ndarray):
+        return src
+    if isinstance(src, Image.Image):
+        return np.asarray(src.convert("RGB"))
+    if isinstance(src, bytes):
+        return _decode_rgb_bytes(src)
+    st = os.stat(src)
+    return _decode_rgb_cached(str(src), st.st_mtime_ns, st.st_size)
+
+def _match_size(arr, ref):
+    if arr.shape == ref.shape:
+        return arr
+    img = Image.fromarray(arr).resize((ref.shape[1], ref.shape[0]), Image.Resampling.LANCZOS)
+    return np.asarray(img)
+
+_PSNR_PEAK_DB = 20 * math.log10(255.0)
+
+def mse_u8(ref, cand, block_bytes=1 << 16):
+    """Mean squared error of two same-shape uint8 arrays.
+
+    Works through ~64 KiB row blocks in integer arithmetic, so diff, square
+    and sum stay in cache instead of building full-size float64 copies. An
+    8-bit difference fits int16; einsum squares and sums it into int64
+    without materialising the squares.
+    """
+    rows = max(1, block_bytes // max(1, ref[0].nbytes))
+    sse = 0
+    for y in range(0, ref.shape[0], rows):
+        d = np.subtract(ref[y:y + rows], cand[y:y + rows], dtype=np.int16).ravel()
+        sse += int(np.einsum("i,i->", d, d, dtype=np.int64))
+    return sse / ref.size
+
 def compute_mse_psnr(orig_path, comp_path):
+    """`orig_path`/`comp_path` may be paths or pre-decoded arrays (see load_rgb)."""
     if np is None:
         Log.warn("Numpy not found. Falling back to PIL-based PSNR (less precise).")
         try:
-            o = Image.open(orig_path).convert("RGB")
-            c = Image.open(comp_path).convert("RGB")
+            o = _open_rgb(orig_path)
+            c = _open_rgb(comp_path)
             if o.size != c.size:
                 c = c.resize(o.size, Image.Resampling.LANCZOS)
             diff = ImageChops.difference(o, c)
@@ -54,38 +167,105 @@ def compute_mse_psnr(orig_path, comp_path):
             return None, 0.0
 
     try:
-        o = Image.open(orig_path).convert("RGB")
-        c = Image.open(comp_path).convert("RGB")
-        if o.size != c.size:
-            c = c.resize(o.size, Image.Resampling.LANCZOS)
-
-        oa = np.asarray(o, dtype=np.float64)
-        ca = np.asarray(c, dtype=np.float64)
-        mse = float(np.mean((oa - ca) ** 2))
+        oa = load_rgb(orig_path)
+        ca = _match_size(load_rgb(comp_path), oa)
+
+        mse = mse_u8(oa, ca)
         if mse == 0:
             return 0.0, float("inf")
-        psnr = 20 * math.log10(255.0 / math.sqrt(mse))
+        psnr = _PSNR_PEAK_DB - 10 * math.log10(mse)
         return mse, psnr
     except Exception as e:
         Log.warn(f"Numpy-based PSNR compute failed: {e}")
         return None, 0.0
 
+def fast_ssim(a_u8, b_u8, win_size=7):
+    """skimage's default SSIM (uniform window, sample covariance) of two same-shape uint8 images.
+
+    The five moment maps are box-filtered with OpenCV's vectorised blur on
+    float64 and combined in place. Channels are scored together, which
+    equals the mean of the per-channel SSIMs.
+    """
+    cv2 = _cv2()
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    n = win_size * win_size
+    cov = n / (n - 1)
+    r = win_size // 2
+
+    def blur(v):
+        return cv2.blur(v, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+
+    x = a_u8.astype(np.float64)
+    y = b_u8.astype(np.float64)
+    mx, my = blur(x), blur(y)
+    sxx = blur(x * x)
+    syy = blur(y * y)
+    sxy = blur(x * y)
+
+    mxy = mx * my
+    mx *= mx
+    my *= my
+    sxx -= mx
+    syy -= my
+    sxy -= mxy
+
+    num = (2 * mxy + c1) * (2 * cov * sxy + c2)
+    den = (mx + my + c1) * (cov * (sxx + syy) + c2)
+    smap = num / den
+    if min(smap.shape[:2]) > 2 * r:
+        smap = smap[r:-r, r:-r]  # drop the border the window can't cover
+    return float(smap.mean(dtype=np.float64))
+
+# A strided PSNR this far from the target is trusted without a full-res pass.
+FAST_PSNR_MARGIN_DB = 1.5
+
+def subsample(arr, stride=2):
+    """Every `stride`-th row and column of `arr`, as a contiguous array."""
+    if np is None or not isinstance(arr, np.ndarray):
+        return None
+    return np.ascontiguousarray(arr[::stride, ::stride])
+
+def compute_mse_psnr_fast(orig_path, comp_path, stride=2, ref_small=None):
+    """Estimates MSE/PSNR from every `stride`-th row and column (1/stride^2 of the pixels).
+
+    `ref_small` is the reference already passed through subsample(); reuse it
+    across candidates so the reference is only sliced once per file.
+    """
+    if np is None:
+        return compute_mse_psnr(orig_path, comp_path)
+    try:
+        oa = load_rgb(orig_path)
+        ca = _match_size(load_rgb(comp_path), oa)
+        if ref_small is None:
+            ref_small = subsample(oa, stride)
+        mse = mse_u8(ref_small, ca[::stride, ::stride])
+        if mse == 0:
+            return 0.0, float("inf")
+        return mse, _PSNR_PEAK_DB - 10 * math.log10(mse)
+    except Exception as e:
+        Log.warn(f"Strided PSNR compute failed: {e}")
+        return None, 0.0
+
 def compute_ssim_skimage(orig_path, comp_path):
-    if ssim_func is None or np is None:
+    """SSIM of two images (paths or arrays), via fast_ssim when OpenCV is available."""
+    cv2, ssim_func = _cv2(), None
+    if cv2 is None: ssim_func = _ssim_func()
+    if np is None or (cv2 is None and ssim_func is None):
         Log.warn("scikit-image or numpy not found. SSIM check skipped.")
         return None
     try:
-        o = Image.open(orig_path).convert("RGB")
-        c = Image.open(comp_path).convert("RGB")
-        if o.size != c.size:
-            c = c.resize(o.size, Image.Resampling.LANCZOS)
-        oa = np.asarray(o, dtype=np.float32)
-        ca = np.asarray(c, dtype=np.float32)
+        oa = load_rgb(orig_path)
+        ca = _match_size(load_rgb(comp_path), oa)
         h, w = oa.shape[:2]
         min_dim = min(h, w)
         if min_dim < 7:
             return 1.0  # Too small for SSIM window
 
+        if cv2 is not None:
+            return fast_ssim(oa, ca)
+
+        oa = oa.astype(np.float32)
+        ca = ca.astype(np.float32)
         desired_win = 7
         win = min(desired_win, min_dim if (min_dim % 2 == 1) else (min_dim - 1))
         if win < 3: win = 3
@@ -101,31 +281,150 @@ def compute_ssim_skimage(orig_path, comp_path):
         Log.warn(f"SSIM (skimage) compute failed: {e}")
         return None
 
+def is_jpeg(src):
+    """True when `src` (a path or encoded bytes) starts with a JPEG SOI marker."""
+    try:
+        if isinstance(src, bytes):
+            return src[:2] == b"\xff\xd8"
+        with open(src, "rb") as f:
+            return f.read(2) == b"\xff\xd8"
+    except OSError:
+        return False
+
+def load_gray_cv2(path, reduce=1):
+    """Grayscale uint8 array of `path` (or encoded bytes) as compute_ssim_cv2 sees it, or None.
+
+    `reduce` of 2, 4 or 8 decodes a JPEG straight to luma at that fraction of
+    its size via libjpeg's scaled IDCT (see probe_reference).
+    """
+    cv2 = _cv2()
+    if cv2 is None:
+        return None
+    if reduce > 1:
+        flags = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}[reduce]
+        if isinstance(path, bytes):
+            return cv2.imdecode(np.frombuffer(path, np.uint8), flags)
+        return cv2.imread(str(path), flags)
+    if isinstance(path, bytes):
+        img = cv2.imdecode(np.frombuffer(path, np.uint8), cv2.IMREAD_COLOR)
+    else:
+        img = cv2.imread(str(path))
+    return None if img is None else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+def probe_reference(original_path, original_gray, probe_dim=1024):
+    """(probe_gray, reduce): the reduced-size original for ssim_cv2_passes' reject gate.
+
+    A JPEG original is decoded again at 1/2, 1/4 or 1/8 scale (the largest
+    that keeps `probe_dim` px on the longer side), which costs a fraction of
+    a full decode. JPEG candidates are then decoded with the same `reduce`,
+    so both sides are filtered identically; a reduced decode compared against
+    an area-shrunk original would read low and reject good candidates.
+    Other originals use shrink_gray and reduce=1.
+    """
+    long_side = max(original_gray.shape[:2])
+    if is_jpeg(original_path):
+        for k in (8, 4, 2):
+            if long_side // k >= probe_dim:
+                reduced = load_gray_cv2(original_path, k)
+                if reduced is not None:
+                    return reduced, k
+                break
+    return shrink_gray(original_gray, probe_dim), 1
+
+def ssim_cv2_passes(original_gray, compressed, threshold, probe_gray=None, fast=False, probe_reduce=1):
+    """Whether `compressed` (path or bytes) reaches `threshold` SSIM against `original_gray`.
+
+    With `probe_gray` (from probe_reference) a miss at that size is final,
+    and only candidates that clear it are scored at full resolution. A
+    reduced-decode probe only gates JPEG candidates; others go straight to
+    the full-resolution check.
+    """
+    if probe_gray is not None and probe_gray is not original_gray:
+        if probe_reduce == 1 or is_jpeg(compressed):
+            s = compute_ssim_cv2_pre(probe_gray, compressed, fast, probe_reduce)
+            if s is None or s < threshold:
+                return False
+    s = compute_ssim_cv2_pre(original_gray, compressed, fast)
+    return s is not None and s >= threshold
+
 def compute_ssim_cv2(original_path, compressed_path):
+    if _cv2() is None:
+        Log.warn("OpenCV (cv2) not found. CV2-based SSIM check skipped.")
+        return None
+    original_gray = load_gray_cv2(original_path)
+    if original_gray is None:
+        return 0.0
+    return compute_ssim_cv2_pre(original_gray, compressed_path)
+
+def shrink_gray(gray, max_dim=1024):
+    """`gray` area-averaged down so its longer side is at most `max_dim`."""
+    cv2 = _cv2()
+    h, w = gray.shape[:2]
+    if cv2 is None or max(h, w) <= max_dim:
+        return gray
+    s = max_dim / max(h, w)
+    return cv2.resize(gray, (max(1, round(w * s)), max(1, round(h * s))), interpolation=cv2.INTER_AREA)
+
+def compute_ssim_cv2_fast(original_path, compressed_path, probe_dim=1024):
+    """compute_ssim_cv2 at no more than `probe_dim` px on the longer side.
+
+    Up to ~100x fewer pixels on camera-sized inputs. Downscaling averages out
+    compression noise, so this reads higher than full-resolution SSIM: use
+    it to reject candidates, and confirm passes at full resolution.
+    """
+    original_gray = load_gray_cv2(original_path)
+    if original_gray is None:
+        return 0.0
+    return compute_ssim_cv2_pre(shrink_gray(original_gray, probe_dim), compressed_path)
+
+def compute_ssim_cv2_pre(original_gray, compressed_path, fast=False, reduce=1):
+    """compute_ssim_cv2 against an original already passed through load_gray_cv2.
+
+    Quality sweeps score many candidates against one original; decoding it
+    once per file instead of once per candidate halves the pixels decoded.
+    The candidate is area-resized to the original's shape, so passing a
+    shrink_gray()ed original gives the compute_ssim_cv2_fast score.
+
+    `fast` scores on the CPU with metrics_fast.ssim_uniform, the same
+    window and formula computed from integral images, instead of skimage.
+    `reduce` is passed to load_gray_cv2 for the candidate.
+    """
+    cv2, ssim_func = _cv2(), _ssim_func()
     if cv2 is None:
         Log.warn("OpenCV (cv2) not found. CV2-based SSIM check skipped.")
         return None
     try:
-        original = cv2.imread(str(original_path))
-        compressed = cv2.imread(str(compressed_path))
-
-        if original is None or compressed is None:
+        compressed_gray = load_gray_cv2(compressed_path, reduce)
+        if original_gray is None or compressed_gray is None:
             return 0.0
 
-        if original.shape != compressed.shape:
-            compressed = cv2.resize(compressed, (original.shape[1], original.shape[0]), interpolation=cv2.INTER_AREA)
-
-        original_gray = cv2.cvtColor(original, cv2.COLOR_BGR2GRAY)
-        compressed_gray = cv2.cvtColor(compressed, cv2.COLOR_BGR2GRAY)
+        if original_gray.shape != compressed_gray.shape:
+            compressed_gray = cv2.resize(compressed_gray, (original_gray.shape[1], original_gray.shape[0]), interpolation=cv2.INTER_AREA)
 
         win_size = min(7, min(original_gray.shape) // 2)
         if win_size % 2 == 0: win_size -= 1
         if win_size < 3: win_size = 3
 
+        cuda = _cuda()
+        if cuda is not None:
+            return cuda.ssim_cuda(original_gray, compressed_gray, win_size=win_size)
+        fast_m = _fast() if fast else None
+        if fast_m is not None:
+            return fast_m.ssim_uniform(original_gray, compressed_gray, win_size=win_size)
         return ssim_func(original_gray, compressed_gray, data_range=255, win_size=win_size)
     except Exception:
         return 0.0
 
+def parse_cwebp_ssim(output):
+    """SSIM from `cwebp -print_ssim` output ("... Total:<dB>"), or None.
+
+    cwebp reports SSIM in dB, i.e. -10*log10(1 - ssim).
+    """
+    m = _CWEBP_SSIM_RE.search(output or "")
+    if not m:
+        return None
+    return 1.0 - 10 ** (-float(m.group(1)) / 10)
+
 def run_butteraugli(orig_path, comp_path, butter_bin):
     if not butter_bin:
         return None
@@ -135,7 +434,7 @@ def run_butteraugli(orig_path, comp_path, butter_bin):
             Log.warn(f"Butteraugli run failed: {out}")
             return None
 
-        m = re.search(r"([0-9]+(?:\.[0-9]+)?)", out)
+        m = _BUTTERAUGLI_RE.search(out)
         if m:
             return float(m.group(1))
         return None
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import functools
+import threading
+from dataclasses import dataclass, field
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+@functools.lru_cache(maxsize=1)
+def cuda_available():
+    """True when OpenCV was built with CUDA and sees at least one device."""
+    try:
+        return cv2 is not None and cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+def _gpu():
+    return cv2.cuda_GpuMat()
+
+@dataclass
+class BufferSSIM:
+    """Device buffers reused across ssim_cuda calls, so a sweep allocates once.
+
+    `ref` is the host array uploaded into g1; scoring many candidates
+    against the same original uploads it only once.
+    """
+    g1: object = field(default_factory=_gpu)
+    g2: object = field(default_factory=_gpu)
+    mu1: object = field(default_factory=_gpu)
+    mu2: object = field(default_factory=_gpu)
+    mu1_sq: object = field(default_factory=_gpu)
+    mu2_sq: object = field(default_factory=_gpu)
+    mu1_mu2: object = field(default_factory=_gpu)
+    sig1_sq: object = field(default_factory=_gpu)
+    sig2_sq: object = field(default_factory=_gpu)
+    sig12: object = field(default_factory=_gpu)
+    t1: object = field(default_factory=_gpu)
+    t2: object = field(default_factory=_gpu)
+    t3: object = field(default_factory=_gpu)
+    buf: object = field(default_factory=_gpu)
+    up: object = field(default_factory=_gpu)
+    ref: object = None
+    filters: dict = field(default_factory=dict)
+
+    def box(self, win):
+        if win not in self.filters:
+            self.filters[win] = cv2.cuda.createBoxFilter(cv2.CV_32FC1, cv2.CV_32FC1, (win, win))
+        return self.filters[win]
+
+    def upload(self, arr, dst):
+        self.up.upload(arr)
+        self.up.convertTo(cv2.CV_32FC1, dst)
+
+_local = threading.local()
+
+# The JPEG sweep alternates between the ~1024 px gate reference and the full
+# size one, so each thread keeps a buffer set per reference for the last two.
+_MAX_REFS = 2
+
+def _buffers(ref):
+    if not hasattr(_local, "bufs"):
+        _local.bufs = {}
+    bufs = _local.bufs
+    b = bufs.get(id(ref))
+    if b is None or b.ref is not ref:
+        if b is None and len(bufs) >= _MAX_REFS: bufs.pop(next(iter(bufs)))
+        b = bufs[id(ref)] = BufferSSIM()
+        b.upload(ref, b.g1)
+        b.ref = ref  # also keeps id(ref) from being reused while cached
+    return b
+
+def ssim_cuda(gray1, gray2, win_size=7, data_range=255.0):
+    """SSIM of two same-shape uint8 grayscale arrays on the GPU.
+
+    Same definition as skimage's structural_similarity defaults (uniform
+    win_size window, sample covariance, mean over the uncropped interior), so
+    scores and thresholds match the CPU path.
+    """
+    b = _buffers(gray1)
+    b.upload(gray2, b.g2)
+
+    c1, c2 = (0.01 * data_range) ** 2, (0.03 * data_range) ** 2
+    np_ = win_size * win_size
+    cov = np_ / (np_ - 1)
+    box = b.box(win_size)
+
+    box.apply(b.g1, b.mu1)
+    box.apply(b.g2, b.mu2)
+    cv2.cuda.multiply(b.g1, b.g1, b.t1)
+    box.apply(b.t1, b.sig1_sq)
+    cv2.cuda.multiply(b.g2, b.g2, b.t1)
+    box.apply(b.t1, b.sig2_sq)
+    cv2.cuda.multiply(b.g1, b.g2, b.t1)
+    box.apply(b.t1, b.sig12)
+
+    cv2.cuda.multiply(b.mu1, b.mu1, b.mu1_sq)
+    cv2.cuda.multiply(b.mu2, b.mu2, b.mu2_sq)
+    cv2.cuda.multiply(b.mu1, b.mu2, b.mu1_mu2)
+    cv2.cuda.addWeighted(b.sig1_sq, cov, b.mu1_sq, -cov, 0, b.sig1_sq)
+    cv2.cuda.addWeighted(b.sig2_sq, cov, b.mu2_sq, -cov, 0, b.sig2_sq)
+    cv2.cuda.addWeighted(b.sig12, cov, b.mu1_mu2, -cov, 0, b.sig12)
+
+    cv2.cuda.addWeighted(b.mu1_mu2, 2, b.mu1_mu2, 0, c1, b.t1)
+    cv2.cuda.addWeighted(b.sig12, 2, b.sig12, 0, c2, b.t2)
+    cv2.cuda.multiply(b.t1, b.t2, b.t3)
+    cv2.cuda.addWeighted(b.mu1_sq, 1, b.mu2_sq, 1, c1, b.t1)
+    cv2.cuda.addWeighted(b.sig1_sq, 1, b.sig2_sq, 1, c2, b.t2)
+    cv2.cuda.multiply(b.t1, b.t2, b.t1)
+    cv2.cuda.divide(b.t3, b.t1, b.buf)
+
+    h, w = gray1.shape[:2]
+    p = (win_size - 1) // 2
+    roi = b.buf.rowRange(p, h - p).colRange(p, w - p)
+    return float(cv2.cuda.sum(roi)[0] / ((h - 2 * p) * (w - 2 * p)))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+def process_pool(max_workers):
+    """ProcessPoolExecutor for CPU-bound per-file work (Pillow, NumPy metrics).
+
+    Uses the forkserver start method where available so workers don't inherit
+    a fork of a parent that may already hold decoded images or threads.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+    else:
+        ctx = multiprocessing.get_context()
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx)
+
+class CpuBudget:
+    """Weighted cap on encoder threads running at once across all workers.
+
+    An encoder call holds `weight` slots (its own thread count) while it runs.
+    Slots are taken under a lock so two callers can never each hold part of
+    the budget while waiting on the other.
+    """
+
+    def __init__(self, capacity, lock=None, sem=None):
+        self.capacity = max(1, capacity)
+        self._lock = lock if lock is not None else threading.Lock()
+        self._sem = sem if sem is not None else threading.BoundedSemaphore(self.capacity)
+
+    @classmethod
+    def shared(cls, manager, capacity=None):
+        """A budget whose primitives live in `manager`, so it can be passed to pool workers."""
+        capacity = max(1, capacity or os.cpu_count() or 1)
+        return cls(capacity, manager.Lock(), manager.BoundedSemaphore(capacity))
+
+    @contextmanager
+    def slots(self, weight=1):
+        weight = max(1, min(int(weight), self.capacity))
+        with self._lock:
+            for _ in range(weight):
+                self._sem.acquire()
+        try:
+            yield
+        finally:
+            for _ in range(weight):
+                self._sem.release()
+
+def budget_slots(budget, weight=1):
+    """`budget.slots(weight)`, or a no-op when running without a budget."""
+    return budget.slots(weight) if budget is not None else nullcontext()
+
+def inner_threads(workers):
+    """Threads each encoder may use so that workers * threads stays near the core count."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers or 1))
@@ -4,20 +4,78 @@ import json
 import csv
 from .logging import Log
 
+REPORT_FIELDS = ["file", "original_size", "final_size", "method", "output_file", "error"]
+
+class ReportStream:
+    """Writes the JSON and/or CSV report one result at a time as files finish.
+
+    Memory stays flat however large the batch, and a crashed run leaves the
+    rows written so far on disk. The JSON report is a top-level array with
+    one result per line. Use as a context manager; either path may be None.
+    """
+
+    def __init__(self, json_path=None, csv_path=None, fieldnames=REPORT_FIELDS):
+        self.json_path, self.csv_path, self.fieldnames = json_path, csv_path, fieldnames
+        self._json = self._csv_file = self._csv = None
+        self._first = True
+
+    def __enter__(self):
+        try:
+            if self.json_path:
+                self._json = open(self.json_path, "w", encoding="utf-8")
+                self._json.write("[")
+        except Exception as e:
+            Log.error(f"Failed to save JSON report: {e}")
+            self._json = None
+        try:
+            if self.csv_path:
+                self._csv_file = open(self.csv_path, "w", newline="", encoding="utf-8")
+                self._csv = csv.DictWriter(self._csv_file, fieldnames=self.fieldnames, extrasaction='ignore')
+                self._csv.writeheader()
+        except Exception as e:
+            Log.error(f"Failed to save CSV report: {e}")
+            self._csv_file = self._csv = None
+        return self
+
+    def write(self, result):
+        if self._json:
+            try:
+                self._json.write(("\n" if self._first else ",\n") + json.dumps(result))
+                self._first = False
+            except Exception as e:
+                Log.error(f"Failed to save JSON report: {e}")
+                self._json.close()
+                self._json = None
+        if self._csv:
+            try:
+                self._csv.writerow(result)
+            except Exception as e:
+                Log.error(f"Failed to save CSV report: {e}")
+                self._csv_file.close()
+                self._csv_file = self._csv = None
+
+    def __exit__(self, *exc):
+        if self._json:
+            try:
+                self._json.write("\n]\n")
+                self._json.close()
+                Log.info(f"JSON report saved to {self.json_path}")
+            except Exception as e:
+                Log.error(f"Failed to save JSON report: {e}")
+        if self._csv_file:
+            try:
+                self._csv_file.close()
+                Log.info(f"CSV report saved to {self.csv_path}")
+            except Exception as e:
+                Log.error(f"Failed to save CSV report: {e}")
+        return False
+
 def save_json_report(filepath, results_list):
-    try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(results_list, f, indent=2)
-        Log.info(f"JSON report saved to {filepath}")
-    except Exception as e:
-        Log.error(f"Failed to save JSON report: {e}")
+    with ReportStream(json_path=filepath) as report:
+        for r in results_list:
+            report.write(r)
 
 def save_csv_report(filepath, results_list, fieldnames):
-    try:
-        with open(filepath, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
-            writer.writeheader()
-            writer.writerows(results_list)
-        Log.info(f"CSV report saved to {filepath}")
-    except Exception as e:
-        Log.error(f"Failed to save CSV report: {e}")
\ No newline at end of file
+    with ReportStream(csv_path=filepath, fieldnames=fieldnames) as report:
+        for r in results_list:
+            report.write(r)
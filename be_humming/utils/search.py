@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import math
+
+def _interpolate(cache, fail_q, pass_q):
+    """Estimates where the margin crosses zero from the probes nearest the bracket."""
+    pts = sorted((q, r[1]) for q, r in cache.items() if r and r[1] is not None and math.isfinite(r[1]))
+    below = [p for p in pts if p[0] <= fail_q]
+    above = [p for p in pts if p[0] >= pass_q]
+    if below and above:
+        (q1, m1), (q2, m2) = below[-1], above[0]
+    elif len(above) >= 2:
+        (q1, m1), (q2, m2) = above[0], above[1]
+    elif len(below) >= 2:
+        (q1, m1), (q2, m2) = below[-2], below[-1]
+    else:
+        return None
+    if m2 <= m1:
+        return None  # margin should grow with q; don't trust a flat/inverted pair
+    return math.ceil(q1 - m1 * (q2 - q1) / (m2 - m1))
+
+def search_quality(evaluate, lo, hi, start=75, step=15, cache=None):
+    """Finds the lowest q in [lo, hi] whose candidate passes.
+
+    `evaluate(q)` returns (passes, margin) where margin is the signed distance
+    to the threshold (>= 0 when passing), or None if q could not be encoded.
+    The metric is assumed monotone in q: the search probes `start`, then one
+    `step` towards the threshold, then interpolates between the probes
+    nearest the threshold, falling back to bisection whenever interpolation
+    stalls. Each q is evaluated at most once; results are kept in `cache`.
+
+    Returns (best_q or None, cache).
+    """
+    cache = {} if cache is None else cache
+    fail_q, pass_q = lo - 1, hi + 1  # the answer lies in (fail_q, pass_q]
+
+    def passed(q):
+        r = cache.get(q)
+        return bool(r and r[0])
+
+    def record(q):
+        nonlocal fail_q, pass_q
+        if q not in cache:
+            cache[q] = evaluate(q)
+        if passed(q): pass_q = min(pass_q, q)
+        else: fail_q = max(fail_q, q)
+
+    for q in cache:
+        if lo <= q <= hi: record(q)
+
+    if lo <= hi and pass_q - fail_q > 1:
+        q = min(max(start, fail_q + 1), pass_q - 1)
+        record(q)
+        record(max(lo, q - step) if passed(q) else min(hi, q + step))
+
+    bisect_next = False
+    while pass_q - fail_q > 1:
+        width = pass_q - fail_q
+        q = None if bisect_next else _interpolate(cache, fail_q, pass_q)
+        if q is None or not fail_q < q < pass_q:
+            q = (fail_q + pass_q) // 2
+            bisect_next = False
+        else:
+            bisect_next = True
+        record(q)
+        # Keep interpolating only while it at least halves the bracket.
+        if bisect_next and (pass_q - fail_q) * 2 <= width:
+            bisect_next = False
+
+    return (pass_q if pass_q <= hi else None), cache
+
+def binary_search(predicate, lo, hi):
+    """Lowest q in [lo, hi] for which `predicate(q)` holds, or None.
+
+    `predicate` must be monotone: false below some q and true from there up.
+    Callers that already know some answers should memoise inside `predicate`.
+    """
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if predicate(mid): best, hi = mid, mid - 1
+        else: lo = mid + 1
+    return best
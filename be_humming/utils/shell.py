@@ -1,47 +1,97 @@
 #!/usr/bin/env python3
 
+import functools
+import os
 import shutil
 import subprocess
-from pathlib import Path
 from .logging import Log
 
-def which_bin(names):
-    """Finds the first available binary from a list of names."""
+@functools.lru_cache(maxsize=None)
+def _which_first(names, path):
     for n in names:
-        p = shutil.which(n)
+        p = shutil.which(n, path=path)
         if p:
             return p
     return None
 
-def run_cmd(cmd, expected_outpaths=None, timeout=60):
+def which_bin(names):
+    """Finds the first available binary from a list of names.
+
+    Lookups are cached per (names, $PATH), so repeated calls don't rescan
+    PATH, and a changed PATH is still honoured.
+    """
+    return _which_first(tuple(names), os.environ.get("PATH"))
+
+def run_cmd_bytes(cmd, timeout=60):
+    """Runs an encoder that writes its bitstream to stdout.
+
+    Returns (True, stdout bytes) or (False, note), so candidates can be
+    measured without ever being written to disk.
+    """
+    try:
+        proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+        if proc.returncode != 0:
+            err = proc.stderr.decode("utf-8", errors="ignore")
+            return False, f"Command failed (code {proc.returncode}): {cmd[0]}. Error: {err}"
+        if not proc.stdout:
+            return False, f"No output produced by {cmd[0]}"
+        return True, proc.stdout
+    except subprocess.TimeoutExpired:
+        return False, f"Command timed out after {timeout}s: {cmd[0]}"
+    except FileNotFoundError:
+        return False, f"Command not found: {cmd[0]}. Please ensure it's in your PATH."
+    except Exception as e:
+        return False, f"An unexpected error occurred: {e}"
+
+def spawn_cmd(cmd):
+    """Starts `cmd` without waiting for it, output discarded. Pair with finish_cmd."""
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def _missing_output(paths):
+    """First of `paths` that is missing or empty, or None. One stat per path."""
+    for p in paths or []:
+        try:
+            if os.stat(p).st_size == 0:
+                return p
+        except OSError:
+            return p
+    return None
+
+def finish_cmd(proc, expected_outpaths=None):
+    """(ok, note) for a spawned process that has exited, with run_cmd's output checks."""
+    if proc.returncode != 0:
+        return False, f"Command failed (code {proc.returncode}): {proc.args[0]}"
+    missing = _missing_output(expected_outpaths)
+    if missing is not None:
+        return False, f"Expected output not produced: {missing}"
+    return True, ""
+
+def run_cmd(cmd, expected_outpaths=None, timeout=60, capture_output=True):
+    """Runs `cmd` and returns (ok, note).
+
+    With capture_output=False the child's stdout/stderr go to /dev/null and
+    the note carries no tool output. That skips creating and draining two
+    pipes per call, which adds up for encoders called thousands of times per
+    batch. (CPython already launches via vfork/posix_spawn, not a full fork.)
+    """
     try:
-        # We use Popen and communicate to handle timeouts and large outputs
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-            errors="ignore",
-        )
-        stdout, stderr = process.communicate(timeout=timeout)
-        returncode = process.returncode
-
-        full_output = stdout + stderr
-
-        if returncode != 0:
-            return False, f"Command failed (code {returncode}): {cmd[0]}. Error: {full_output}"
-
-        if expected_outpaths:
-            for p in expected_outpaths:
-                if not Path(p).exists() or Path(p).stat().st_size == 0:
-                    return False, f"Expected output not produced: {p}. Cmd output: {full_output}"
+        if capture_output:
+            proc = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="ignore", timeout=timeout)
+        else:
+            proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+        full_output = (proc.stdout or "") + (proc.stderr or "")
+
+        if proc.returncode != 0:
+            return False, f"Command failed (code {proc.returncode}): {cmd[0]}. Error: {full_output}"
+
+        missing = _missing_output(expected_outpaths)
+        if missing is not None:
+            return False, f"Expected output not produced: {missing}. Cmd output: {full_output}"
         return True, full_output
 
     except subprocess.TimeoutExpired:
-        process.kill()
         return False, f"Command timed out after {timeout}s: {cmd[0]}"
     except FileNotFoundError:
         return False, f"Command not found: {cmd[0]}. Please ensure it's in your PATH."
     except Exception as e:
-        return False, f"An unexpected error occurred: {e}"
\ No newline at end of file
+        return False, f"An unexpected error occurred: {e}"
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""cache_put/cache_get round trips, including a renamed copy of a cached input."""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from be_humming.utils.cache import cache_get, cache_key, cache_put
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.cache = self.tmp / "cache"
+        self.out = self.tmp / "out"
+        self.out.mkdir()
+        self.inp = self.tmp / "a.png"
+        self.inp.write_bytes(b"input bytes")
+        self.key = cache_key(self.inp, "hybrid-perceptual", {"q": 80})
+        produced = self.out / "a.webp"
+        produced.write_bytes(b"encoded output")
+        self.result = {"file": str(self.inp), "method": "webp (q=80)", "output_file": str(produced), "final_bytes": 14}
+        cache_put(self.cache, self.key, self.result)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_round_trip(self):
+        fresh = self.tmp / "fresh"
+        fresh.mkdir()
+        hit = cache_get(self.cache, self.key, fresh, self.inp)
+        self.assertEqual(hit["method"], "webp (q=80)")
+        self.assertEqual(hit["final_bytes"], 14)
+        self.assertTrue(hit["cached"])
+        self.assertEqual(Path(hit["output_file"]), fresh / "a.webp")
+        self.assertEqual((fresh / "a.webp").read_bytes(), b"encoded output")
+
+    def test_renamed_input_gets_its_own_name(self):
+        renamed = self.tmp / "b.png"
+        shutil.copy(self.inp, renamed)
+        key = cache_key(renamed, "hybrid-perceptual", {"q": 80})
+        self.assertEqual(key, self.key)  # content, not name, is the key
+        hit = cache_get(self.cache, key, self.out, renamed)
+        self.assertEqual(Path(hit["output_file"]), self.out / "b.webp")
+        self.assertEqual((self.out / "b.webp").read_bytes(), b"encoded output")
+        self.assertEqual((self.out / "a.webp").read_bytes(), b"encoded output")
+
+    def test_rerun_into_same_dir_leaves_no_temp_files(self):
+        for _ in range(2):
+            self.assertIsNotNone(cache_get(self.cache, self.key, self.out, self.inp))
+        self.assertEqual(sorted(p.name for p in self.out.iterdir()), ["a.webp"])
+        self.assertEqual(sorted(p.suffix for p in self.cache.iterdir()), [".json", ".webp"])
+
+    def test_output_is_not_linked_to_the_blob(self):
+        hit = cache_get(self.cache, self.key, self.out, self.inp)
+        Path(hit["output_file"]).write_bytes(b"edited")
+        fresh = self.tmp / "fresh"
+        fresh.mkdir()
+        again = cache_get(self.cache, self.key, fresh, self.inp)
+        self.assertEqual(Path(again["output_file"]).read_bytes(), b"encoded output")
+
+    def test_miss(self):
+        other = cache_key(self.inp, "hybrid-perceptual", {"q": 81})
+        self.assertNotEqual(other, self.key)
+        self.assertIsNone(cache_get(self.cache, other, self.out, self.inp))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""search_quality agrees with a linear scan on monotone predicates."""
+
+import random
+import unittest
+from collections import Counter
+
+from be_humming.utils.search import search_quality
+
+def monotone_margin(rng, lo, hi):
+    """A random non-decreasing margin over [lo, hi], with plateaus, crossing zero anywhere or nowhere."""
+    level, values = 0.0, {}
+    for q in range(lo, hi + 1):
+        level += rng.choice((0.0, rng.uniform(0.01, 3.0)))
+        values[q] = level
+    threshold = rng.uniform(-1.0, level + 1.0)
+    return lambda q: values[q] - threshold
+
+class SearchQualityTest(unittest.TestCase):
+    def test_matches_linear_scan(self):
+        rng = random.Random(0)
+        for _ in range(1000):
+            lo = rng.randint(1, 60)
+            hi = rng.randint(lo - 1, 100)
+            margin = monotone_margin(rng, lo, hi)
+            calls = Counter()
+
+            def evaluate(q):
+                calls[q] += 1
+                return (margin(q) >= 0, margin(q))
+
+            best, _ = search_quality(evaluate, lo, hi, start=rng.randint(1, 100), step=rng.randint(1, 30))
+            expected = next((q for q in range(lo, hi + 1) if margin(q) >= 0), None)
+            with self.subTest(lo=lo, hi=hi):
+                self.assertEqual(best, expected)
+                self.assertTrue(all(n == 1 for n in calls.values()), calls)
+
+    def test_reuses_cache(self):
+        margin = lambda q: q - 42
+        cache = {q: (margin(q) >= 0, margin(q)) for q in (30, 50)}
+        seen = []
+        best, _ = search_quality(lambda q: seen.append(q) or (margin(q) >= 0, margin(q)), 1, 100, cache=cache)
+        self.assertEqual(best, 42)
+        self.assertNotIn(30, seen)
+        self.assertNotIn(50, seen)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""The OpenCV SSIM paths score exactly what scikit-image's structural_similarity does."""
+
+import importlib.util
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from be_humming.utils import metrics
+
+HAVE_DEPS = all(importlib.util.find_spec(m) for m in ("cv2", "skimage"))
+
+def pair(rng, shape):
+    a = rng.integers(0, 256, shape, dtype=np.uint8)
+    noise = rng.integers(-40, 41, shape)
+    return a, np.clip(a.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+@unittest.skipUnless(HAVE_DEPS, "needs OpenCV and scikit-image")
+class SsimTest(unittest.TestCase):
+    def setUp(self):
+        from skimage.metrics import structural_similarity
+        self.ref = structural_similarity
+        self.rng = np.random.default_rng(0)
+
+    def test_ssim_uniform_matches_skimage_on_gray(self):
+        from be_humming.utils.metrics_fast import ssim_uniform
+        for shape in ((7, 7), (48, 64), (301, 257)):
+            for win in (3, 7, 11):
+                if min(shape) < win: continue
+                a, b = pair(self.rng, shape)
+                with self.subTest(shape=shape, win=win):
+                    expected = self.ref(a.astype(np.float64), b.astype(np.float64), win_size=win, data_range=255.0)
+                    self.assertAlmostEqual(ssim_uniform(a, b, win), expected, places=9)
+
+    def test_compute_ssim_skimage_matches_on_rgb(self):
+        for shape in ((48, 64, 3), (211, 190, 3)):
+            a, b = pair(self.rng, shape)
+            with self.subTest(shape=shape):
+                expected = self.ref(a.astype(np.float64), b.astype(np.float64), channel_axis=2, win_size=7, data_range=255.0)
+                self.assertAlmostEqual(metrics.compute_ssim_skimage(a, b), expected, places=9)
+
+    def test_compute_ssim_skimage_matches_on_gray(self):
+        a, b = pair(self.rng, (120, 97))
+        expected = self.ref(a.astype(np.float64), b.astype(np.float64), win_size=7, data_range=255.0)
+        score = metrics.compute_ssim_skimage(Image.fromarray(a), Image.fromarray(b))
+        self.assertAlmostEqual(score, expected, places=9)
+
+    def test_fallback_without_opencv_agrees(self):
+        a, b = pair(self.rng, (90, 80, 3))
+        with mock.patch.object(metrics, "_cv2", lambda: None):
+            fallback = metrics.compute_ssim_skimage(a, b)
+        self.assertAlmostEqual(metrics.compute_ssim_skimage(a, b), fallback, places=5)
+
+    def test_identical_images_score_one(self):
+        a, _ = pair(self.rng, (64, 64, 3))
+        self.assertAlmostEqual(metrics.compute_ssim_skimage(a, a.copy()), 1.0, places=12)
+
+if __name__ == "__main__":
+    unittest.main()